@@ -0,0 +1,6 @@
+from website.asgi import create_asgi_app
+
+
+# Async entry point, serve it with an ASGI server: uvicorn asgi:app
+# The bug JSON endpoints run on the event loop, the rest of the app is the same Flask app as main.py.
+app = create_asgi_app()
@@ -0,0 +1,8 @@
+"""
+Benchmarks of the bug tracker.
+
+    python -m benchmarks                     load test of the main scenarios, see benchmarks/runner.py
+    python benchmarks/<name>.py              focused measurements of one optimization
+
+data.py generates the users and bugs all of them run on, report.py computes and compares the results.
+"""
@@ -0,0 +1,128 @@
+"""
+Reproducible users and bugs for the benchmarks.
+
+The same seed always produces the same rows, so two runs of a benchmark (e.g. before and after a change)
+read the same data. Rows are generated lazily and inserted with one executemany per chunk, so seeding
+10 million bugs takes time but no more memory than a single chunk.
+"""
+import random
+from datetime import datetime, timedelta
+from itertools import islice
+from sqlalchemy import insert, select, func
+from website import db
+from website.models import Bug, User, BUG_STATUSES, BUG_PRIORITIES
+
+PASSWORD = 'bench!pass'  # password of every generated user
+CHUNK_SIZE = 10000
+START_DATE = datetime(2023, 1, 1)
+
+# Words the titles and descriptions are made of, so the full-text searches have realistic hit counts
+WORDS = (
+    'login', 'logout', 'session', 'password', 'email', 'dashboard', 'search', 'export', 'json', 'page',
+    'button', 'form', 'table', 'sort', 'filter', 'date', 'priority', 'status', 'account', 'settings',
+    'slow', 'broken', 'missing', 'wrong', 'crash', 'timeout', 'error', 'layout', 'alignment', 'mobile',
+    'browser', 'cache', 'database', 'upload', 'download', 'link', 'image', 'font', 'color', 'scroll',
+)
+STATUS_WEIGHTS = (5, 2, 3)  # Open, In Progress, Resolved
+PRIORITY_WEIGHTS = (3, 5, 2)  # Low, Medium, High
+
+
+def email(n):
+    """Email of the n-th generated user, n starting at 0."""
+    return f'user{n}@bench.example.com'
+
+
+def generate_users(count, password_hash):
+    """
+    Yields `count` users as insert() parameter dicts.
+
+    Args:
+        password_hash (str): Stored for every user. Hashing is far too slow to do per row, and every
+            user then logs in with PASSWORD.
+    """
+    for n in range(count):
+        yield {'email': email(n), 'username': f'user{n}', 'password': password_hash}
+
+
+def generate_bugs(count, user_ids, seed=0, days=365):
+    """
+    Yields `count` bugs as insert() parameter dicts.
+
+    Args:
+        user_ids (list): The reporters, bugs are spread evenly over them.
+        seed (int): Seed of the random generator, the same seed gives the same bugs.
+        days (int): The creation dates are spread over this many days from START_DATE, in increasing order.
+    """
+    rng = random.Random(seed)
+    step = timedelta(days=days) / max(count, 1)
+    for n in range(count):
+        title_words = rng.choices(WORDS, k=rng.randint(2, 5))
+        yield {
+            'title': ' '.join(title_words).capitalize()[:100],
+            'description': ' '.join(rng.choices(WORDS, k=rng.randint(10, 60))).capitalize() + '.',
+            'status': rng.choices(BUG_STATUSES, STATUS_WEIGHTS)[0],
+            'priority': rng.choices(BUG_PRIORITIES, PRIORITY_WEIGHTS)[0],
+            'date_created': START_DATE + step * n,
+            'user_id': user_ids[n % len(user_ids)],
+        }
+
+
+def insert_chunks(model, rows, chunk_size=CHUNK_SIZE):
+    """Inserts an iterable of parameter dicts, one executemany and one commit per chunk."""
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        db.session.execute(insert(model), chunk)
+        db.session.commit()
+
+
+def seed(app, bugs, users=None, seed=0, chunk_size=CHUNK_SIZE):
+    """
+    Fills the database of an app with generated users and bugs.
+
+    Args:
+        app: An app created by create_app(), usually on a temporary database.
+        bugs (int): Number of bugs.
+        users (int): Number of users, one per 1000 bugs (at least one) by default.
+        seed (int): Seed of the bug generator.
+
+    Returns:
+        list: The ids of the users, in the order of email(n).
+    """
+    if users is None:
+        users = max(1, bugs // 1000)
+    with app.app_context():
+        insert_chunks(User, generate_users(users, app.extensions['password_hasher'].hash(PASSWORD)), chunk_size)
+        user_ids = db.session.scalars(select(User.id).order_by(User.id)).all()
+        insert_chunks(Bug, generate_bugs(bugs, user_ids, seed), chunk_size)
+    return user_ids
+
+
+def add_user(app, name, bugs=0, password_hash=None, seed=0):
+    """
+    Creates one more user with `bugs` bugs.
+
+    Args:
+        password_hash (str): Hash of PASSWORD to store, computed by the app's hasher when not given.
+
+    Returns:
+        str: The email to log in with, the password being PASSWORD.
+    """
+    with app.app_context():
+        address = f'{name}@bench.example.com'
+        password_hash = password_hash or app.extensions['password_hasher'].hash(PASSWORD)
+        db.session.add(User(email=address, username=name, password=password_hash))
+        db.session.commit()
+        user_id = db.session.scalar(select(User.id).where(User.email == address))
+        if bugs:
+            insert_chunks(Bug, generate_bugs(bugs, [user_id], seed))
+    return address
+
+
+def count_rows(app):
+    """The (users, bugs) counts of the database of an app."""
+    with app.app_context():
+        return (db.session.scalar(select(func.count()).select_from(User)),
+                db.session.scalar(select(func.count()).select_from(Bug)))
@@ -0,0 +1,89 @@
+"""
+Login latency under concurrency, with password hashing inline and on the hashing process pool.
+
+Threads log in over and over through the test client while two other threads keep reading
+GET /json?limit=20, to show how much a login burst slows down normal bug traffic.
+
+Usage:
+    python benchmarks/login_latency.py [--concurrency 16] [--seconds 5] [--workers 2]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from website import create_app, db
+from benchmarks import data
+from benchmarks.report import percentile
+
+EMAIL = data.email(0)
+PASSWORD = data.PASSWORD
+
+
+def run(label, workers, options):
+    with tempfile.TemporaryDirectory() as directory:
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.join(directory, "bench.db")}',
+            'PASSWORD_HASH_WORKERS': workers,
+            'PASSWORD_HASH_QUEUE_LIMIT': options.queue_limit,
+            'RATE_LIMIT_ENABLED': False,  # the same account logs in over and over
+        })
+        data.seed(app, 100, users=1)
+
+        reader = app.test_client()
+        reader.post('/login', data={'email': EMAIL, 'password': PASSWORD})
+
+        logins, rejected, reads = [], [], []
+        deadline = time.perf_counter() + options.seconds
+
+        def log_in():
+            client = app.test_client()
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                response = client.post('/login', data={'email': EMAIL, 'password': PASSWORD})
+                elapsed = time.perf_counter() - started
+                (rejected if response.status_code == 503 else logins).append(elapsed)
+
+        def read():
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                reader.get('/json?limit=20').get_data()
+                reads.append(time.perf_counter() - started)
+
+        threads = [threading.Thread(target=log_in) for _ in range(options.concurrency)]
+        threads += [threading.Thread(target=read) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        app.extensions['password_hasher'].shutdown()
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose()
+
+    print(f'{label:<12} {len(logins) / options.seconds:>9.1f} {statistics.median(logins) * 1000 if logins else 0:>9.0f} '
+          f'{percentile(logins, 0.95) * 1000:>9.0f} {len(rejected):>6} '
+          f'{percentile(reads, 0.5) * 1000:>9.1f} {percentile(reads, 0.95) * 1000:>9.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--workers', type=int, default=2, help='hashing processes of the pool run')
+    parser.add_argument('--queue-limit', type=int, default=16)
+    options = parser.parse_args()
+
+    print(f'{options.concurrency} login threads, 2 reader threads, {options.seconds:g}s')
+    print(f'{"hashing":<12} {"logins/s":>9} {"p50 ms":>9} {"p95 ms":>9} {"503s":>6} {"read p50":>9} {"read p95":>9}')
+    run('inline', 0, options)
+    run(f'pool({options.workers})', options.workers, options)
+
+
+if __name__ == '__main__':
+    main()
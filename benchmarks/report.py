@@ -0,0 +1,98 @@
+"""
+Latency statistics, peak memory and baseline files of the benchmarks.
+"""
+import json
+import resource
+import sys
+
+# Metrics of a scenario result, and whether a higher value is better
+METRICS = {
+    'p50_ms': False,
+    'p95_ms': False,
+    'p99_ms': False,
+    'throughput': True,
+    'peak_rss_mb': False,
+}
+
+
+def percentile(values, fraction):
+    """The value below which `fraction` of the values lie (nearest rank), nan for no values."""
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process so far, in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / (1024 if sys.platform == 'darwin' else 1)  # bytes on macOS, KiB elsewhere
+
+
+def summarize(latencies, seconds, errors=0):
+    """
+    The result of a scenario.
+
+    Args:
+        latencies (list): Seconds taken by each successful request.
+        seconds (float): Wall time the requests were sent for.
+        errors (int): Number of requests answered with a 4xx or 5xx status.
+    """
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'throughput': len(latencies) / seconds,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def print_results(results):
+    print(f'{"scenario":<18} {"requests":>9} {"errors":>7} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} '
+          f'{"req/s":>9} {"rss MiB":>8}')
+    for name, result in results.items():
+        print(f'{name:<18} {result["requests"]:>9} {result["errors"]:>7} {result["p50_ms"]:>9.2f} '
+              f'{result["p95_ms"]:>9.2f} {result["p99_ms"]:>9.2f} {result["throughput"]:>9.1f} '
+              f'{result["peak_rss_mb"]:>8.1f}')
+
+
+def save_baseline(path, results, settings):
+    """Writes the results and the settings they were measured with to a JSON file."""
+    with open(path, 'w') as file:
+        json.dump({'settings': settings, 'results': results}, file, indent=2, sort_keys=True)
+
+
+def compare(results, settings, path, tolerance):
+    """
+    Prints the change of every metric against a baseline saved by save_baseline.
+
+    Args:
+        tolerance (float): Relative change beyond which a metric counts as a regression, e.g. 0.1 for 10%.
+
+    Returns:
+        list: The (scenario, metric, baseline value, new value) of the regressions.
+    """
+    with open(path) as file:
+        baseline = json.load(file)
+    if baseline['settings'] != settings:
+        print(f'warning: the baseline was measured with other settings: {baseline["settings"]}')
+
+    regressions = []
+    print(f'{"scenario":<18} {"metric":<12} {"baseline":>10} {"now":>10} {"change":>8}')
+    for name, result in results.items():
+        before = baseline['results'].get(name)
+        if before is None:
+            print(f'{name:<18} (not in the baseline)')
+            continue
+        for metric, higher_is_better in METRICS.items():
+            old, new = before[metric], result[metric]
+            change = (new - old) / old if old else 0.0
+            worse = -change if higher_is_better else change
+            flag = ''
+            if worse > tolerance:
+                flag = ' REGRESSION'
+                regressions.append((name, metric, old, new))
+            print(f'{name:<18} {metric:<12} {old:>10.2f} {new:>10.2f} {change:>+8.1%}{flag}')
+    return regressions
@@ -0,0 +1,157 @@
+"""
+Load test of the app: p50/p95/p99 latency, throughput and peak RSS of scripted scenarios.
+
+A database is seeded once with data.seed(), then every scenario runs in a fresh process on it, so its
+peak RSS is its own and no scenario warms the caches of the next one. Each process creates the app with
+create_app() and runs --concurrency workers, each logged in as a different generated user, for --seconds.
+With --server the requests go over HTTP to a werkzeug server started in that process instead of
+through the test client.
+
+Usage:
+    python -m benchmarks [--bugs 100000] [--scenarios login index ...] [--seconds 5] [--concurrency 4]
+                         [--server] [--database bench.db] [--save-baseline baseline.json]
+                         [--compare baseline.json] [--tolerance 0.1]
+
+    --database keeps the seeded database between runs, which saves seeding 10M rows every time.
+    --compare exits with status 1 when a metric is worse than the baseline by more than --tolerance.
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from website import create_app, db
+from benchmarks import data, report
+from benchmarks.scenarios import SCENARIOS, TestClient, HttpClient, Worker
+
+
+def make_app(path):
+    # every worker logs in from 127.0.0.1, the login throttling would turn the run into a 429 benchmark
+    return create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}', 'RATE_LIMIT_ENABLED': False})
+
+
+def run_scenario(name, path, options, context):
+    """Runs one scenario and returns its report.summarize() result. Called in a process of its own."""
+    app = make_app(path)
+    server = None
+    if options.server:
+        from werkzeug.serving import make_server
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)  # no access log line per request
+        server = make_server('127.0.0.1', 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f'http://127.0.0.1:{server.server_port}'
+
+    workers = []
+    for number in range(options.concurrency):
+        client = HttpClient(base_url) if server else TestClient(app)
+        worker = Worker(app, client, random.Random(options.seed * 1000 + number), context, number)
+        if worker.log_in().status != 302:
+            raise RuntimeError(f'{worker.email} could not log in')
+        workers.append(worker)
+
+    scenario = SCENARIOS[name]
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+
+    def work(worker, deadline, record):
+        while time.perf_counter() < deadline:
+            request = scenario(worker)
+            started = time.perf_counter()
+            response = request()
+            elapsed = time.perf_counter() - started
+            if record:
+                with lock:
+                    if response.status >= 400:
+                        errors[0] += 1
+                    else:
+                        latencies.append(elapsed)
+
+    def run_workers(seconds, record):
+        deadline = time.perf_counter() + seconds
+        threads = [threading.Thread(target=work, args=(worker, deadline, record)) for worker in workers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    run_workers(options.warmup, record=False)
+    started = time.perf_counter()
+    run_workers(options.seconds, record=True)
+    result = report.summarize(latencies, time.perf_counter() - started, errors[0])
+
+    if server:
+        server.shutdown()
+    app.extensions['password_hasher'].shutdown()
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+    return result
+
+
+def seed_database(path, options):
+    app = make_app(path)
+    users, bugs = data.count_rows(app)
+    if bugs:
+        print(f'using {path}: {users} users, {bugs} bugs')
+    else:
+        started = time.perf_counter()
+        data.seed(app, options.bugs, options.users, options.seed)
+        users, bugs = data.count_rows(app)
+        print(f'seeded {users} users and {bugs} bugs in {time.perf_counter() - started:.1f}s')
+    context = {
+        'users': users, 'bugs': bugs, 'deletion_bugs': options.deletion_bugs,
+        'password_hash': app.extensions['password_hasher'].hash(data.PASSWORD),
+    }
+    app.extensions['password_hasher'].shutdown()
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+    return context
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--bugs', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=None, help='one per 1000 bugs by default')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--warmup', type=float, default=1, help='seconds of untimed requests before measuring')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--deletion-bugs', type=int, default=1000, help='bugs of each account_deletion account')
+    parser.add_argument('--server', action='store_true', help='send the requests over HTTP to a local server')
+    parser.add_argument('--database', help='seeded database file to create or reuse')
+    parser.add_argument('--save-baseline', metavar='FILE')
+    parser.add_argument('--compare', metavar='FILE')
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.abspath(options.database or os.path.join(directory, 'bench.db'))
+        context = seed_database(path, options)
+        settings = {
+            'bugs': context['bugs'], 'users': context['users'], 'seconds': options.seconds,
+            'concurrency': options.concurrency, 'server': options.server, 'deletion_bugs': options.deletion_bugs,
+        }
+        print(f'{options.concurrency} workers, {options.seconds:g}s per scenario, '
+              f'{"HTTP server" if options.server else "test client"}')
+
+        results = {}
+        for name in options.scenarios:
+            # not a multiprocessing.Pool: its daemonic workers could not start the password hashing processes
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+                results[name] = executor.submit(run_scenario, name, path, options, context).result()
+    report.print_results(results)
+
+    if options.save_baseline:
+        report.save_baseline(options.save_baseline, results, settings)
+        print(f'baseline saved to {options.save_baseline}')
+    if options.compare:
+        regressions = report.compare(results, settings, options.compare, options.tolerance)
+        if regressions:
+            print(f'{len(regressions)} metrics regressed by more than {options.tolerance:.0%}')
+            raise SystemExit(1)
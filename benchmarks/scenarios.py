@@ -0,0 +1,178 @@
+"""
+The requests replayed by `python -m benchmarks`, and the clients sending them.
+
+A scenario is a function taking a Worker and returning the request to time, as a function without
+arguments returning the Response of the client. Anything the scenario does before returning it (creating an
+account to delete, picking a bug to update...) is not part of the measured latency.
+"""
+import html
+import http.cookiejar
+import itertools
+import re
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import namedtuple
+from json import dumps as json_dumps, loads as json_loads
+from website.models import BUG_STATUSES, BUG_PRIORITIES
+from . import data
+
+
+Response = namedtuple('Response', 'status body')
+
+
+class TestClient:
+    """Sends the requests to the app in-process through Flask's test client."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, url, data=None, json=None):
+        response = self.client.open(url, method=method, data=data, json=json)
+        body = response.get_data()  # read streamed bodies to the end, like a real client
+        response.close()
+        return Response(response.status_code, body)
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None  # time the request itself, not the page it redirects to
+
+
+class HttpClient:
+    """Sends the requests over HTTP to a running server, keeping the session cookie."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect
+        )
+
+    def request(self, method, url, data=None, json=None):
+        headers = {}
+        body = None
+        if json is not None:
+            body, headers['Content-Type'] = json_dumps(json).encode(), 'application/json'
+        elif data is not None:
+            body = urllib.parse.urlencode(data).encode()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        request = urllib.request.Request(self.base_url + url, data=body, headers=headers, method=method)
+        try:
+            with self.opener.open(request) as response:
+                return Response(response.status, response.read())
+        except urllib.error.HTTPError as error:  # 3xx (redirects are not followed), 4xx and 5xx
+            return Response(error.code, error.read())
+
+
+class Worker:
+    """
+    One simulated user: a client logged in as one of the generated users, and its random generator.
+
+    Attributes:
+        app: The app under test, for the scenarios that prepare data directly in its database.
+        client: TestClient or HttpClient.
+        rng (random.Random): Seeded per worker, so the same run sends the same requests.
+        context (dict): Settings of the run shared by all workers, e.g. 'bugs' and 'password_hash'.
+        state (dict): Scratch space of the scenario, e.g. the ids of the bugs created by this worker.
+    """
+
+    def __init__(self, app, client, rng, context, number):
+        self.app = app
+        self.client = client
+        self.rng = rng
+        self.context = context
+        self.number = number
+        self.email = data.email(number % context['users'])
+        self.state = {}
+
+    def log_in(self, email=None):
+        return self.client.request('POST', '/login', data={'email': email or self.email, 'password': data.PASSWORD})
+
+
+def login(worker):
+    return lambda: worker.client.request('POST', '/login', data={'email': worker.email, 'password': data.PASSWORD})
+
+
+NEXT_PAGE_URL = re.compile(rb'class="next-page" data-url="([^"]+)"')
+
+
+def index(worker):
+    """Opens the dashboard and scrolls through up to 3 pages of it, one request per call, like script.js."""
+    url = worker.state.get('next_page')
+    if url is None or worker.state['pages'] >= worker.state['depth']:
+        sort = worker.rng.choice(('newest', 'oldest', 'priority', 'status'))
+        url = f'/?sort={sort}'
+        worker.state.update(pages=0, depth=worker.rng.randint(1, 3))
+
+    def load():
+        response = worker.client.request('GET', url)
+        match = NEXT_PAGE_URL.search(response.body or b'')
+        worker.state['next_page'] = html.unescape(match.group(1).decode()) if match else None
+        worker.state['pages'] += 1
+        return response
+    return load
+
+
+def json_page(worker):
+    after = worker.rng.randrange(max(worker.context['bugs'], 1))
+    return lambda: worker.client.request('GET', f'/json?after={after}&limit=100')
+
+
+def json_export(worker):
+    # a streamed export of 10000 bugs, the whole table would make one request last minutes at 10M rows
+    after = worker.rng.randrange(max(worker.context['bugs'] - 10000, 1))
+    return lambda: worker.client.request('GET', f'/json?after={after}&limit=10000&format=ndjson')
+
+
+def search(worker):
+    rng = worker.rng
+    category = rng.choice(('title', 'text', 'status', 'priority', 'date_created'))
+    if category in ('title', 'text'):
+        keyword = ' '.join(rng.sample(data.WORDS, rng.randint(1, 2)))
+    elif category == 'status':
+        keyword = rng.choice(BUG_STATUSES)[:4].lower()
+    elif category == 'priority':
+        keyword = rng.choice(BUG_PRIORITIES)
+    else:
+        keyword = (data.START_DATE.replace(day=rng.randint(1, 28), month=rng.randint(1, 12))).strftime('%Y-%m-%d')
+    query = urllib.parse.urlencode({'keyword': keyword, 'category': category})
+    return lambda: worker.client.request('GET', f'/search?{query}')
+
+
+def crud(worker):
+    """Creates a bug, reads it, updates it and deletes it, one request per call."""
+    step = worker.state.setdefault('steps', itertools.cycle(('create', 'read', 'update', 'delete')))
+    action = next(step)
+    bug = {'title': 'Benchmark bug', 'description': 'Created by the crud scenario', 'status': 'Open', 'priority': 'Low'}
+    if action == 'create':
+        def create():
+            response = worker.client.request('POST', '/bugs', json=bug)
+            worker.state['bug_id'] = json_loads(response.body)['bug_id'] if response.status == 201 else None
+            return response
+        return create
+    bug_id = worker.state['bug_id']
+    if action == 'read':
+        return lambda: worker.client.request('GET', f'/bugs/{bug_id}')
+    if action == 'update':
+        return lambda: worker.client.request('PUT', f'/bugs/{bug_id}', json=dict(bug, status='Resolved'))
+    return lambda: worker.client.request('DELETE', f'/bugs/{bug_id}')
+
+
+def account_deletion(worker):
+    """Deletes an account with context['deletion_bugs'] bugs. Creating it and logging in is not timed."""
+    count = worker.state['accounts'] = worker.state.get('accounts', 0) + 1
+    email = data.add_user(worker.app, f'deleted{worker.number}x{count}', worker.context['deletion_bugs'],
+                          worker.context['password_hash'], seed=count)
+    worker.log_in(email)
+    return lambda: worker.client.request('POST', '/confirm-delete', data={'confirm': 'yes'})
+
+
+SCENARIOS = {
+    'login': login,
+    'index': index,
+    'json_page': json_page,
+    'json_export': json_export,
+    'search': search,
+    'crud': crud,
+    'account_deletion': account_deletion,
+}
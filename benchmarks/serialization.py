@@ -0,0 +1,76 @@
+"""
+Rows per second of the bug JSON serialization, old ORM path against website.serializers.
+
+The 'orm' path is what get_bugs and search_bug did before: load Bug instances, build a dict per bug
+with strftime and encode the list with the json module. The 'core' path reads tuples from
+serializers.select_bugs() and encodes them with serializers.iter_json_array (orjson when installed).
+
+Usage:
+    python benchmarks/serialization.py [--rows 10000 100000 1000000] [--repeat 3]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from website import create_app, db, serializers
+from website.models import Bug
+from benchmarks import data
+
+
+def orm_path():
+    bug_list = []
+    for bug in Bug.query.all():
+        bug_list.append({
+            'id': bug.id,
+            'title': bug.title,
+            'description': bug.description,
+            'status': bug.status,
+            'priority': bug.priority,
+            'date_created': bug.date_created.strftime('%Y-%m-%d %H:%M:%S'),
+        })
+    return json.dumps(bug_list)
+
+
+def core_path():
+    result = db.session.execute(serializers.select_bugs().execution_options(yield_per=1000))
+    return ''.join(serializers.iter_json_array(result.partitions()))
+
+
+def measure(function, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        db.session.expunge_all()  # start every run with an empty identity map
+        started = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--repeat', type=int, default=3)
+    options = parser.parse_args()
+
+    print(f'encoder: {"orjson" if serializers.orjson else "json"}')
+    print(f'{"rows":>9} {"orm rows/s":>12} {"core rows/s":>12} {"speedup":>8}')
+    for rows in options.rows:
+        with tempfile.TemporaryDirectory() as directory:
+            app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.join(directory, "bench.db")}'})
+            data.seed(app, rows)
+            with app.app_context():
+                assert json.loads(orm_path()) == json.loads(core_path())
+                orm = measure(orm_path, options.repeat)
+                core = measure(core_path, options.repeat)
+                for engine in db.engines.values():
+                    engine.dispose()
+        print(f'{rows:>9} {rows / orm:>12.0f} {rows / core:>12.0f} {orm / core:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
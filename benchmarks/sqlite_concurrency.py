@@ -0,0 +1,90 @@
+"""
+Read/write throughput of the sqlite storage profiles under concurrent load.
+
+Every worker process builds its own app with create_app() on a shared database file, like gunicorn
+workers do, logs in and then sends a mix of GET /json?after=..&limit=50 reads and POST /bugs writes
+through the test client for a fixed time. The run is repeated for each STORAGE_PROFILE.
+
+Usage:
+    python benchmarks/sqlite_concurrency.py [--processes 4] [--seconds 5] [--bugs 20000] [--write-ratio 0.2]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from website import create_app
+from benchmarks import data
+
+
+def make_app(path, profile):
+    # hash inline: the workers are daemonic pool processes, which cannot start a hashing pool of their own
+    return create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}', 'STORAGE_PROFILE': profile,
+                       'PASSWORD_HASH_WORKERS': 0})
+
+
+def seed(path, profile, bugs):
+    app = make_app(path, profile)
+    data.seed(app, bugs)
+
+
+def worker(args):
+    path, profile, seconds, write_ratio, bugs, seed_value = args
+    rng = random.Random(seed_value)
+    app = make_app(path, profile)
+    client = app.test_client()
+    client.post('/login', data={'email': data.email(seed_value % max(1, bugs // 1000)), 'password': data.PASSWORD})
+
+    counts = {'reads': 0, 'writes': 0, 'errors': 0}
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        if rng.random() < write_ratio:
+            response = client.post('/bugs', json={
+                'title': 'Concurrent bug', 'description': 'Written by the benchmark', 'status': 'Open', 'priority': 'High',
+            })
+            kind = 'writes'
+        else:
+            response = client.get(f'/json?after={rng.randrange(bugs)}&limit=50')
+            response.get_data()
+            kind = 'reads'
+        if response.status_code >= 400:
+            counts['errors'] += 1
+        else:
+            counts[kind] += 1
+    return counts
+
+
+def run(profile, options):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bench.db')
+        seed(path, profile, options.bugs)
+        jobs = [(path, profile, options.seconds, options.write_ratio, options.bugs, n) for n in range(options.processes)]
+        with multiprocessing.get_context('spawn').Pool(options.processes) as pool:
+            results = pool.map(worker, jobs)
+    totals = {key: sum(result[key] for result in results) for key in ('reads', 'writes', 'errors')}
+    print(f'{profile:<10} {totals["reads"] / options.seconds:>10.0f} {totals["writes"] / options.seconds:>10.0f} '
+          f'{totals["errors"]:>8}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--bugs', type=int, default=20000)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--profiles', nargs='+', default=['default', 'wal'])
+    options = parser.parse_args()
+
+    print(f'{options.processes} processes, {options.seconds:g}s, {options.bugs} bugs, {options.write_ratio:.0%} writes')
+    print(f'{"profile":<10} {"reads/s":>10} {"writes/s":>10} {"errors":>8}')
+    for profile in options.profiles:
+        run(profile, options)
+
+
+if __name__ == '__main__':
+    main()
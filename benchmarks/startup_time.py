@@ -0,0 +1,107 @@
+"""
+Startup time of a worker process: import, create_app and the first requests, with and without warm-up.
+
+Every run starts a fresh Python process, like a recycled gunicorn worker without preload_app, against a
+database that is new, at the current schema version, or created before the schema was versioned (full
+schema introspection on every start). The medians of the runs are printed. create_app includes importing
+the blueprints and models, which gunicorn's preload_app does once in the master (see gunicorn.conf.py).
+
+Usage:
+    python benchmarks/startup_time.py [--runs 5] [--bugs 1000]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Requests timed after create_app: rendered templates and a database read
+FIRST_REQUESTS = [('GET', '/login'), ('GET', '/sign-up'), ('POST', '/login')]
+
+
+def child(path, warm_up):
+    """Runs in the measured process: prints the timings of one start as JSON."""
+    started = time.perf_counter()
+    from website import create_app
+    imported = time.perf_counter()
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}', 'WARM_UP': warm_up,
+                      'RATE_LIMIT_ENABLED': False, 'PASSWORD_HASH_WORKERS': 0})
+    created = time.perf_counter()
+
+    client = app.test_client()
+    timings = {'import_ms': (imported - started) * 1000, 'create_app_ms': (created - imported) * 1000}
+    for attempt in ('first', 'second'):
+        request_started = time.perf_counter()
+        for method, url in FIRST_REQUESTS:
+            client.open(url, method=method, data={'email': 'nobody@example.com', 'password': 'wrong'}).close()
+        timings[f'{attempt}_requests_ms'] = (time.perf_counter() - request_started) * 1000
+    print(json.dumps(timings))
+
+
+def measure(path, warm_up, runs, prepare=None):
+    """Median timings of `runs` fresh processes. prepare(path) runs before each of them."""
+    results = []
+    for _ in range(runs):
+        if prepare:
+            prepare(path)
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child', path] + (['--warm-up'] if warm_up else []),
+            check=True, capture_output=True, text=True, cwd=ROOT,
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return {key: statistics.median(result[key] for result in results) for key in results[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--bugs', type=int, default=1000, help='bugs in the existing database')
+    parser.add_argument('--child', metavar='PATH', help=argparse.SUPPRESS)
+    parser.add_argument('--warm-up', action='store_true', help=argparse.SUPPRESS)
+    options = parser.parse_args()
+    if options.child:
+        return child(options.child, options.warm_up)
+
+    from website import create_app, db
+    from benchmarks import data
+
+    with tempfile.TemporaryDirectory() as directory:
+        existing = os.path.join(directory, 'existing.db')
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{existing}'})
+        data.seed(app, options.bugs, users=10)
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose()
+
+        def remove(path):
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+
+        def unversion(path):
+            import sqlite3
+            with sqlite3.connect(path) as connection:
+                connection.execute('PRAGMA user_version = 0')
+
+        cases = [
+            ('new database', os.path.join(directory, 'new.db'), False, remove),
+            ('unversioned', existing, False, unversion),
+            ('current', existing, False, None),
+            ('current+warm', existing, True, None),
+        ]
+        print(f'{options.runs} runs per case, {options.bugs} bugs, medians')
+        print(f'{"database":<14} {"import ms":>10} {"create ms":>10} {"1st reqs ms":>12} {"2nd reqs ms":>12}')
+        for label, path, warm_up, prepare in cases:
+            result = measure(path, warm_up, options.runs, prepare)
+            print(f'{label:<14} {result["import_ms"]:>10.1f} {result["create_app_ms"]:>10.1f} '
+                  f'{result["first_requests_ms"]:>12.1f} {result["second_requests_ms"]:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
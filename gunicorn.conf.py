@@ -0,0 +1,37 @@
+# Gunicorn settings: gunicorn -c gunicorn.conf.py main:app
+import os
+
+bind = os.environ.get('BIND', '127.0.0.1:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('THREADS', 4))
+# An open /bugs/changes/stream holds one of these threads, so a worker serves at most CHANGE_STREAM_MAX_OPEN
+# (2) streams and answers 503 beyond that. Route the streams to the ASGI entry point (uvicorn asgi:app),
+# which serves them on its event loop, when more than a handful of clients follow the changes.
+
+# recycle workers to bound memory growth, with jitter so they do not all restart at once. An account purge cut
+# short by a restart is picked up again by the first request of the next worker (see website.purge.init_app).
+max_requests = int(os.environ.get('MAX_REQUESTS', 1000))
+max_requests_jitter = max_requests // 10
+
+# Import main and create the app once in the master: the schema is migrated once instead of by every worker,
+# the templates are compiled once, and a recycled worker is a fork of a ready app instead of a cold import.
+# It also gives every worker the same SECRET_KEY, create_app draws a random one per process.
+preload_app = True
+
+
+def when_ready(server):
+    # runs in the master after the app is loaded and before the first worker is forked
+    from website.warmup import precompile_templates
+
+    app = server.app.wsgi()
+    server.log.info('Compiled %d templates', precompile_templates(app))
+
+
+def post_fork(server, worker):
+    # sqlite connections opened in the master (schema migration) must not be used by the children, drop them
+    # and open the worker's own pool before it accepts requests
+    from website.warmup import dispose_engines, prime_pool
+
+    app = server.app.wsgi()
+    dispose_engines(app)
+    worker.log.info('Opened %d pooled connections', prime_pool(app))
@@ -12,11 +12,21 @@ db = SQLAlchemy()  # creates an instance of SQLAlchemy
 DB_NAME = "database.db"  # Specifies the name of the SQLite database file to be used
 
 
-def create_app():
+def create_app(config=None):
     app = Flask(__name__, static_folder='static')
+    from .serializers import FastJSONProvider
+
+    app.json = FastJSONProvider(app)  # jsonify() encodes with orjson when it is installed
     app.config['SECRET_KEY'] = os.urandom(32)  
     app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{DB_NAME}'
+    if config:
+        app.config.update(config)  # overrides, e.g. a scratch database for tools and benchmarks
+
+    from . import storage
+
+    storage.configure(app)  # WAL and other sqlite PRAGMAs, connection pool options, read-only engine
     db.init_app(app)  # Initializes the SQLAlchemy extension for the Flask app.
+    storage.init_app(app)
 
     from .views import views 
     from .auth import auth
@@ -33,13 +43,33 @@ def create_app():
     login_manager.login_view = 'auth.login'  #where do we need to go if we are not logged in. It redirects us in auth.login. 
     login_manager.init_app(app)  #we are telling login_manager which app we are using. 
 
+    from . import usercache
+
+    user_cache = usercache.init_app(app)
+
     @login_manager.user_loader  #this is telling flask how we load a user. 
     def load_user(id):
-        return User.query.get(int(id))  # we dont need to define that id=id because by default it searched the id.  
+        return user_cache.load(int(id))  # answered from the user cache, the database is only hit on a miss.
         # we pass an id to the load_user(id) and then it returns the user with this id. 
 
-    with app.app_context():
-        db.create_all()
+    from . import queryplan, purge, hashing, httpcache, changes, profiling, ratelimit, archive, stats, schema
+
+    queryplan.init_app(app)
+    purge.init_app(app)
+    hashing.init_app(app)  # scrypt on a bounded process pool, see hashing.PasswordHasher
+    httpcache.init_app(app)  # ETags and cached responses of the bug lists
+    changes.init_app(app)  # /bugs/changes and its event stream
+    profiling.init_app(app)  # per-endpoint timings and /metrics, only with PROFILING_ENABLED
+    ratelimit.init_app(app)  # token buckets in front of login and sign-up, before any hashing
+    archive.init_app(app)  # `flask archive-bugs`, moves old resolved bugs to bug_archive
+    stats.init_app(app)  # `flask rebuild-stats`
+
+    # tables, indexes and triggers; only a PRAGMA read when the database is already at the current version
+    schema.init_app(app)
+    if app.config.get('WARM_UP'):
+        from .warmup import warm_up
+
+        warm_up(app)  # compile the templates and open the pooled connections before the first request
     #initialize_database()
     
 
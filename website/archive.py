@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta
+import click
+from sqlalchemy import select, insert, delete
+from . import db
+from .models import Bug, BugArchive
+
+
+# Only bugs in this status are archived, whatever their age
+ARCHIVED_STATUS = 'Resolved'
+# Columns copied from bug to bug_archive, archived_at is filled in by the database
+ARCHIVED_COLUMNS = ('id', 'title', 'description', 'status', 'priority', 'date_created', 'user_id', 'version')
+
+
+def archive_bugs(before, chunk_size=5000):
+    """
+    Moves the resolved bugs created before a date from the bug table to bug_archive.
+
+    Args:
+        before (datetime): Bugs created before this date are archived.
+        chunk_size (int): Bugs moved per transaction, so the write lock is never held for long.
+
+    Returns:
+        int: The number of archived bugs.
+
+    Notes:
+        - Each chunk is copied with INSERT ... SELECT and deleted from bug in the same transaction, so a bug is
+          always in exactly one of the two tables.
+        - The change log records an 'archive' change instead of a 'delete' for them (see website.schema), and
+          the delete triggers take them out of the full-text index. The triggers tell the two apart by the id
+          being in bug_archive, which holds because bug ids are never reused (AUTOINCREMENT).
+        - The bugs to move are found through the (status, priority, date_created) index.
+    """
+    archived = 0
+    while True:
+        bug_ids = db.session.scalars(
+            select(Bug.id).where(Bug.status == ARCHIVED_STATUS, Bug.date_created < before).limit(chunk_size)
+        ).all()
+        if bug_ids:
+            db.session.execute(insert(BugArchive).from_select(
+                ARCHIVED_COLUMNS,
+                select(*[getattr(Bug, column) for column in ARCHIVED_COLUMNS]).where(Bug.id.in_(bug_ids)),
+            ))
+            db.session.execute(delete(Bug).where(Bug.id.in_(bug_ids)).execution_options(synchronize_session=False))
+            db.session.commit()
+            archived += len(bug_ids)
+        if len(bug_ids) < chunk_size:
+            return archived
+
+
+def init_app(app):
+    """
+    Registers `flask archive-bugs`, to be run periodically (e.g. nightly from cron).
+
+    Config:
+        ARCHIVE_AFTER_DAYS (int): Age of the resolved bugs to archive, 365 by default.
+        ARCHIVE_CHUNK_SIZE (int): Bugs moved per transaction, 5000 by default.
+    """
+    @app.cli.command('archive-bugs')
+    @click.option('--days', type=int, default=None, help='Archive resolved bugs older than this many days.')
+    def archive_bugs_command(days):
+        """Move old resolved bugs out of the bug table into bug_archive."""
+        if days is None:
+            days = app.config.get('ARCHIVE_AFTER_DAYS', 365)
+        count = archive_bugs(datetime.utcnow() - timedelta(days=days), app.config.get('ARCHIVE_CHUNK_SIZE', 5000))
+        click.echo(f'{count} resolved bugs older than {days} days archived.')
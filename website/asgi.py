@@ -0,0 +1,278 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from itsdangerous import BadSignature
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine  # needs greenlet
+# The ASGI mode needs: pip install starlette aiosqlite a2wsgi uvicorn
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route, Mount
+from . import create_app, db, serializers, storage, changes
+from .models import Bug, User
+from .views import BUG_DETAIL_FIELDS, EXPORT_BATCH_SIZE, EXPORT_MIMETYPES, export_query, search_query, changes_page
+
+
+class AsyncChangeFeed(changes.ChangeFeed):
+    """
+    changes.ChangeFeed for the event loop: the poller is an asyncio task and the streams are coroutines.
+
+    The buffer is shared by every stream of the process exactly like in the threaded feed, an open stream
+    only costs a suspended coroutine.
+
+    Args:
+        engine: The AsyncEngine to read the change log with.
+        logger: Where read errors are logged, the logger of the Flask app.
+        **kwargs: poll_interval, buffer_size and batch_size, see changes.ChangeFeed.
+    """
+
+    def __init__(self, engine, logger, **kwargs):
+        super().__init__(None, **kwargs)
+        self.engine = engine
+        self.logger = logger
+        self._condition = asyncio.Condition()
+        self._task = None
+
+    async def read_changes(self, since, limit):
+        async with self.engine.connect() as connection:
+            rows = await connection.execute(changes.select_changes(since, limit))
+            return [dict(zip(changes.CHANGE_FIELDS, row)) for row in rows]
+
+    async def events(self, since=None, timeout=15):
+        """Async version of changes.ChangeFeed.events."""
+        await self._subscribe()
+        try:
+            cursor = self.last_seq if since is None else since
+            while True:
+                async with self._condition:
+                    try:
+                        await asyncio.wait_for(self._condition.wait_for(lambda: self._has_events(cursor)), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                    events, buffer_start = self._buffered(cursor), self.buffer_start
+
+                if events is None:
+                    # behind the buffer: catch up from the log itself
+                    events = changes.encode_events(await self.read_changes(cursor, self.batch_size))
+                    if not events:  # the missing changes were pruned
+                        cursor = buffer_start
+                        continue
+
+                if not events:
+                    yield None
+                for seq, event in events:
+                    yield event
+                    cursor = seq
+        finally:
+            self.subscribers -= 1
+
+    async def _subscribe(self):
+        async with self._condition:
+            if not self.subscribers:
+                async with self.engine.connect() as connection:
+                    self._reset(await connection.scalar(changes.select_latest_seq()) or 0)
+            self.subscribers += 1
+            if self._task is None:
+                self._task = asyncio.get_running_loop().create_task(self._poll())
+            self._condition.notify_all()
+
+    async def _poll(self):
+        while True:
+            async with self._condition:
+                await self._condition.wait_for(lambda: self.subscribers)
+                since = self.last_seq
+
+            try:
+                new_changes = await self.read_changes(since, self.batch_size)
+            except Exception:
+                new_changes = []
+                self.logger.exception('Reading the bug change log failed')
+
+            async with self._condition:
+                if self._extend(since, new_changes):
+                    self._condition.notify_all()
+
+            if len(new_changes) < self.batch_size:
+                await asyncio.sleep(self.poll_interval)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+
+
+def create_asgi_app(config=None):
+    """
+    Creates the ASGI application: the bug JSON endpoints as async handlers, everything else served by Flask.
+
+    GET /json, /search, /bugs/<id>, /bugs/changes and /bugs/changes/stream run on the event loop and read
+    through aiosqlite, so a slow client downloading a large export or an idle change stream holds a
+    suspended coroutine instead of a worker thread. The pages, the forms, login and every write go to the
+    Flask app created by create_app(config), mounted as a WSGI app. Both share the models, the query builders
+    of website.views, the serializers and the session cookie, so a user logged in through Flask is logged
+    in here too.
+
+    Args:
+        config (dict): Passed on to create_app.
+
+    Returns:
+        Starlette: The application, e.g. `uvicorn asgi:app` with the asgi.py at the root of the repository.
+
+    Notes:
+        - The async handlers only read. They answer without the response cache and ETags of the Flask views.
+        - A request whose session cookie carries no logged in user is passed to the Flask app as is, so
+          Flask-Login decides: it logs the user in from the remember-me cookie (and sends back a session
+          cookie that the next requests are answered with here), or redirects to the login page.
+        - The async engine uses the database and the PRAGMAs of the Flask app, with query_only on.
+    """
+    flask_app = create_app(config)
+    with flask_app.app_context():
+        url = db.engine.url
+    engine = create_async_engine(url.set(drivername='sqlite+aiosqlite'))
+    storage.install_pragmas(engine.sync_engine, dict(flask_app.config['SQLITE_PRAGMAS'], query_only='ON'))
+
+    feed = AsyncChangeFeed(
+        engine,
+        flask_app.logger,
+        poll_interval=flask_app.config.get('CHANGE_FEED_POLL_INTERVAL', 1.0),
+        buffer_size=flask_app.config.get('CHANGE_FEED_BUFFER_SIZE', 1000),
+    )
+    sessions = flask_app.session_interface.get_signing_serializer(flask_app)
+    session_max_age = int(flask_app.permanent_session_lifetime.total_seconds())
+
+    async def current_user_id(request):
+        """The id of the user in the Flask session cookie, None if there is none (see login_required)."""
+        cookie = request.cookies.get(flask_app.config['SESSION_COOKIE_NAME'])
+        if not cookie:
+            return None
+        try:
+            user_id = int(sessions.loads(cookie, max_age=session_max_age).get('_user_id'))
+        except (BadSignature, TypeError, ValueError):
+            return None
+        async with engine.connect() as connection:
+            return await connection.scalar(select(User.id).where(User.id == user_id))
+
+    flask_wsgi = WSGIMiddleware(flask_app)
+
+    def login_required(handler):
+        async def wrapper(request):
+            if await current_user_id(request) is None:
+                # the Flask view answers instead, with Flask-Login's remember-me cookie and user loader
+                return flask_wsgi
+            return await handler(request)
+        return wrapper
+
+    def json_response(obj, status_code=200):
+        return Response(serializers.dumps(obj), status_code=status_code, media_type='application/json')
+
+    @login_required
+    async def get_bugs(request):
+        """views.get_bugs on the event loop."""
+        try:
+            query, fields, output_format, limit = export_query(request.query_params)
+        except ValueError as error:
+            return json_response({'error': str(error)}, 400)
+        encode = _encode_ndjson if output_format == 'ndjson' else _encode_json_array
+        media_type = EXPORT_MIMETYPES[output_format]
+
+        async def partitions():
+            async with engine.connect() as connection:
+                result = await connection.stream(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+                async for rows in result.partitions():
+                    yield rows
+
+        if limit is not None and limit <= EXPORT_BATCH_SIZE:
+            return Response(''.join([chunk async for chunk in encode(partitions(), fields)]), media_type=media_type)
+        return StreamingResponse(encode(partitions(), fields), media_type=media_type)
+
+    @login_required
+    async def get_bug(request):
+        """views.get_bug on the event loop."""
+        async with engine.connect() as connection:
+            result = await connection.execute(
+                serializers.select_bugs(BUG_DETAIL_FIELDS).where(Bug.id == request.path_params['bug_id'])
+            )
+            row = result.first()
+        if row is None:
+            return json_response({'error': 'Bug not found'}, 404)
+        return json_response(serializers.rows_to_dicts([row], BUG_DETAIL_FIELDS)[0])
+
+    @login_required
+    async def search_bug(request):
+        """views.search_bug on the event loop."""
+        try:
+            query = search_query(request.query_params, flask_app.config.get('FULL_TEXT_SEARCH'))
+        except ValueError as error:
+            return json_response({'error': str(error)}, 400)
+        async with engine.connect() as connection:
+            rows = (await connection.execute(query)).all()
+        return json_response(serializers.rows_to_dicts(rows))
+
+    @login_required
+    async def bug_changes(request):
+        """views.bug_changes on the event loop."""
+        try:
+            since, limit = changes_page(request.query_params)
+        except ValueError as error:
+            return json_response({'error': str(error)}, 400)
+        change_list = await feed.read_changes(since, limit)
+        return json_response({'changes': change_list, 'last_seq': change_list[-1]['seq'] if change_list else since})
+
+    @login_required
+    async def stream_bug_changes(request):
+        """views.stream_bug_changes on the event loop."""
+        since = request.headers.get('Last-Event-ID') or request.query_params.get('since')
+        try:
+            since = int(since) if since is not None else None
+        except ValueError:
+            return json_response({'error': 'since must be an integer'}, 400)
+        keepalive = flask_app.config.get('CHANGE_STREAM_KEEPALIVE', 15)
+        deadline = time.monotonic() + flask_app.config.get('CHANGE_STREAM_MAX_AGE', 300)
+
+        async def generate():
+            yield 'retry: 1000\n\n'
+            async for event in feed.events(since, timeout=keepalive):
+                yield event if event is not None else ': keepalive\n\n'
+                if time.monotonic() > deadline:
+                    return
+
+        return StreamingResponse(generate(), media_type='text/event-stream',
+                                 headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    @asynccontextmanager
+    async def lifespan(app):
+        yield
+        await feed.close()
+        await engine.dispose()
+
+    app = Starlette(
+        routes=[
+            Route('/json', get_bugs),
+            Route('/search', search_bug),
+            Route('/bugs/changes', bug_changes),
+            Route('/bugs/changes/stream', stream_bug_changes),
+            Route('/bugs/{bug_id:int}', get_bug),  # GET only, PUT, PATCH and DELETE fall through to Flask
+            Mount('/', flask_wsgi),
+        ],
+        lifespan=lifespan,
+    )
+    app.state.flask_app = flask_app
+    app.state.engine = engine
+    return app
+
+
+async def _encode_json_array(partitions, fields):
+    """serializers.iter_json_array over an async iterator of partitions."""
+    yield '['
+    separator = ''
+    async for rows in partitions:
+        if rows:
+            yield separator + serializers.dumps(serializers.rows_to_dicts(rows, fields))[1:-1]
+            separator = ','
+    yield ']'
+
+
+async def _encode_ndjson(partitions, fields):
+    """serializers.iter_ndjson over an async iterator of partitions."""
+    async for rows in partitions:
+        yield ''.join(serializers.iter_ndjson([rows], fields))
@@ -1,9 +1,9 @@
-from flask import Blueprint, render_template, request, flash, redirect, url_for
-from .models import User, db, Bug
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import Blueprint, render_template, request, flash, redirect, url_for, current_app
+from .models import User, db
 from . import db   ##means from __init__.py import db
 from flask_login import login_user, login_required, logout_user, current_user  
 from .password import is_valid_password
+from . import purge, usercache, hashing
 
 
 
@@ -24,6 +24,7 @@ def update_username():
     new_username = request.form.get('new_username')
     current_user.username = new_username
     db.session.commit()
+    usercache.invalidate(current_user.id)
     flash('Username updated successfully!', category='success')
     return redirect(url_for('auth.account_settings'))
 
@@ -34,7 +35,7 @@ def update_password():
     old_password = request.form.get('old_password')
     new_password = request.form.get('new_password')
     new_password2 = request.form.get('new_password2')
-    if not check_password_hash(current_user.password, old_password):
+    if not hashing.hasher().verify(current_user.password, old_password):
         flash('Current password is incorrect!', category='danger')
     elif not is_valid_password(new_password):
             flash('Password must be at least 6 characters long and contain at least one special character.', category='danger')
@@ -42,8 +43,9 @@ def update_password():
         flash('Passwords don\'t match.', category='danger')
 
     else:
-        current_user.password = generate_password_hash(new_password, method='scrypt')
+        current_user.password = hashing.hasher().hash(new_password)
         db.session.commit()
+        usercache.invalidate(current_user.id)
         flash('Password updated successfully!', category='success')
     
     return redirect(url_for('auth.account_settings'))
@@ -65,6 +67,10 @@ def delete_account_2():
     This function deletes the user's account and associated data, such as bugs,
     when the user initiates an account deletion request.
 
+    The bugs are removed with a single set-based DELETE instead of being loaded and deleted one by one.
+    Accounts with more than ACCOUNT_PURGE_ASYNC_THRESHOLD bugs are disabled immediately and purged by a
+    background job (see website.purge), so the request returns without waiting for the deletion.
+
     Returns:
         Flask Response: A redirect to the login page or another page after successful
         account deletion. In case of an error, it redirects back to the account settings
@@ -84,17 +90,15 @@ def delete_account_2():
             return redirect(url_for('auth.account_settings'))
 
         elif confirmation == 'yes':
-            # Get the user's account and associated bugs
-            user = current_user
-            bugs = Bug.query.filter_by(user_id=user.id).all()
-
-            # Delete associated bug related to this user
-            for bug in bugs:
-                db.session.delete(bug)
-
-            # Delete the user's account
-            db.session.delete(user)
-            db.session.commit()
+            user = current_user._get_current_object()
+            user_id = user.id
+            if purge.has_more_bugs(user_id, current_app.config.get('ACCOUNT_PURGE_ASYNC_THRESHOLD', 10000)):
+                # Too many bugs to delete within the request: disable the account now, delete it in the background
+                purge.schedule_purge(user)
+            else:
+                # Delete the user's bugs with one DELETE statement, then the account, in one transaction
+                purge.delete_user(user_id)
+            usercache.invalidate(user_id)
 
             # Logout the user after account deletion
             logout_user()
@@ -122,7 +126,11 @@ def login():
         user = User.query.filter_by(email=email).first()  # searching if this user exists in our db by searching emails. 
         # It will return the first result 
         if user:
-            if check_password_hash(user.password, password):  #it searches if the password the user enters matches the hash we have stored in our data center. 
+            if hashing.hasher().verify(user.password, password):  #it searches if the password the user enters matches the hash we have stored in our data center. 
+                if hashing.hasher().needs_rehash(user.password):
+                    # the configured hashing cost changed since this hash was made, store a new one while we know the password
+                    user.password = hashing.hasher().hash(password)
+                    db.session.commit()
                 login_user(user, remember=True)  #remembers that the user is logged in while the server is running 
                 return redirect(url_for('views.index'))  # redirect user to the home page after he logs in. 
             else:
@@ -168,8 +176,7 @@ def sign_up():
             
 
         else:
-            new_user = User(email=email, username=username, password=generate_password_hash(
-                password1, method='scrypt'))
+            new_user = User(email=email, username=username, password=hashing.hasher().hash(password1))
             db.session.add(new_user)  # adds the new user to the database 
             db.session.commit()  #commit the changes. Updates the database with the new user. 
 
@@ -0,0 +1,170 @@
+import json
+from datetime import datetime
+from flask import request, current_app
+from .models import Bug
+
+
+# Maximum length of the bug columns that have one, checked before anything is written
+FIELD_LENGTHS = {
+    'title': Bug.__table__.c.title.type.length,
+    'description': None,
+    'status': Bug.__table__.c.status.type.length,
+    'priority': Bug.__table__.c.priority.type.length,
+}
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/jsonl')
+
+
+class BatchError(Exception):
+    """Raised when the request body of a batch endpoint cannot be read as a list of items."""
+
+
+def read_items():
+    """
+    Reads the items of a batch request.
+
+    The body is either a JSON array or, with an NDJSON content type, one JSON value per line.
+    NDJSON bodies are read line by line from the request stream instead of being parsed as one document.
+
+    Returns:
+        list: The decoded items.
+
+    Raises:
+        BatchError: If the body is not valid JSON/NDJSON or contains more than BATCH_MAX_ITEMS items.
+    """
+    max_items = current_app.config.get('BATCH_MAX_ITEMS', 50000)
+    if request.mimetype in NDJSON_MIMETYPES:
+        items = []
+        for number, line in enumerate(request.stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                raise BatchError(f'Invalid JSON on line {number}')
+            if len(items) > max_items:
+                break
+    else:
+        items = request.get_json(silent=True)
+        if not isinstance(items, list):
+            raise BatchError('Request body must be a JSON array or NDJSON')
+    if len(items) > max_items:
+        raise BatchError(f'A batch can contain at most {max_items} items')
+    return items
+
+
+def chunks(items, size=None):
+    """Splits a list into lists of BATCH_CHUNK_SIZE items, each one is written in its own transaction."""
+    size = size or current_app.config.get('BATCH_CHUNK_SIZE', 1000)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _check_fields(item, required):
+    """Returns the bug columns of an item ready to be written, or raises ValueError describing the problem."""
+    if not isinstance(item, dict):
+        raise ValueError('Item must be an object')
+    unknown = set(item) - set(FIELD_LENGTHS) - {'id', 'date_created'}
+    if unknown:
+        raise ValueError(f'Unknown fields: {", ".join(sorted(unknown))}')
+
+    values = {}
+    for field, length in FIELD_LENGTHS.items():
+        if field not in item:
+            if required:
+                raise ValueError(f'Missing field: {field}')
+            continue
+        value = item[field]
+        if not isinstance(value, str) or not value:
+            raise ValueError(f'{field} must be a non-empty string')
+        if length and len(value) > length:
+            raise ValueError(f'{field} must be at most {length} characters')
+        values[field] = value
+
+    if 'date_created' in item:
+        try:
+            values['date_created'] = datetime.strptime(item['date_created'], '%Y-%m-%d %H:%M:%S')
+        except (TypeError, ValueError):
+            raise ValueError("date_created must be formatted as 'YYYY-MM-DD HH:MM:SS'")
+    return values
+
+
+def _check_id(value):
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError('id must be an integer')
+    return value
+
+
+def validate_new_bug(item):
+    """
+    Validates an item of POST /bugs/batch.
+
+    Returns:
+        dict: The columns of the new bug. 'date_created' is optional, so imported bugs can keep their original date.
+    """
+    if isinstance(item, dict) and 'id' in item:
+        raise ValueError('New bugs cannot have an id')
+    values = _check_fields(item, required=True)
+    values.setdefault('date_created', datetime.utcnow())
+    return values
+
+
+def validate_bug_changes(item):
+    """
+    Validates an item of PATCH /bugs/batch.
+
+    Returns:
+        dict: The 'id' of the bug and the columns to change, at least one of them.
+    """
+    values = _check_fields(item, required=False)
+    if not values:
+        raise ValueError('Nothing to update')
+    values['id'] = _check_id(item.get('id'))
+    return values
+
+
+def validate_bug_patch(item):
+    """
+    Validates the body of PATCH /bugs/<id>.
+
+    Returns:
+        tuple: (values, version). values holds the columns to change, at least one of them. version is the
+        version of the bug the client started from, or None to update whatever the current version is.
+    """
+    if not isinstance(item, dict):
+        raise ValueError('Body must be a JSON object')
+    if 'id' in item:
+        raise ValueError('The id of the bug is given by the URL')
+    item = dict(item)
+    version = item.pop('version', None)
+    if version is not None and (isinstance(version, bool) or not isinstance(version, int)):
+        raise ValueError('version must be an integer')
+    values = _check_fields(item, required=False)
+    if not values:
+        raise ValueError('Nothing to update')
+    return values, version
+
+
+def validate_bug_id(item):
+    """Validates an item of DELETE /bugs/batch, either a bug id or an object with an 'id'."""
+    if isinstance(item, dict):
+        if set(item) != {'id'}:
+            raise ValueError('Item must only contain the id')
+        item = item['id']
+    return _check_id(item)
+
+
+def validate(items, validator):
+    """
+    Validates every item of a batch before anything is written.
+
+    Returns:
+        tuple: (values, errors). values holds the validated items in order, errors one
+        {'index': ..., 'error': ...} dict per invalid item.
+    """
+    values, errors = [], []
+    for index, item in enumerate(items):
+        try:
+            values.append(validator(item))
+        except ValueError as e:
+            errors.append({'index': index, 'error': str(e)})
+    return values, errors
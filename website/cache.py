@@ -0,0 +1,54 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class MemoryCache:
+    """
+    Process-local cache with a time to live and least-recently-used eviction.
+
+    It has the get/set/delete interface of a shared cache client (memcached, redis), so the caches of the
+    app can be pointed at one of those instead through their *_BACKEND config, and this class stands in for
+    it in a single process.
+
+    Args:
+        max_entries (int): Evict the least recently used entry above this many entries.
+        ttl (float): Default number of seconds an entry stays valid.
+    """
+
+    def __init__(self, max_entries=1024, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the value stored for key, or None if there is none or it expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
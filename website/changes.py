@@ -0,0 +1,230 @@
+import threading
+import time
+from bisect import bisect_right
+from datetime import datetime, timedelta
+import click
+from sqlalchemy import select, delete, func
+from . import db, storage, serializers
+from .models import BugChange
+
+
+# The change log is appended to by triggers on the bug and bug_archive tables (see website.schema), in the
+# transaction of the write itself, so every code path writing bugs shows up in it without calling anything.
+
+# Attributes of a serialized change, in output order
+CHANGE_FIELDS = ('seq', 'op', 'bug_id', 'user_id', 'title', 'status', 'priority', 'changed_at')
+
+
+def select_changes(since, limit):
+    """A Core SELECT of the next `limit` changes after seq `since`, oldest first. Walks the primary key."""
+    return select(
+        BugChange.seq, BugChange.op, BugChange.bug_id, BugChange.user_id, BugChange.title, BugChange.status,
+        BugChange.priority, func.substr(BugChange.changed_at, 1, 19).label('changed_at'),
+    ).where(BugChange.seq > since).order_by(BugChange.seq).limit(limit)
+
+
+def read_changes(since, limit):
+    """The changes after seq `since` as the dictionaries returned by the API."""
+    return [dict(zip(CHANGE_FIELDS, row)) for row in storage.read(select_changes(since, limit))]
+
+
+def select_latest_seq():
+    """A Core SELECT of the seq of the newest change, answered from the end of the primary key."""
+    return select(func.max(BugChange.seq))
+
+
+def latest_seq():
+    """The seq of the newest change, 0 when the log is empty."""
+    return db.session.scalar(select_latest_seq()) or 0
+
+
+def format_event(change):
+    """Encodes a change as a Server-Sent Event. The id lets EventSource resume with Last-Event-ID."""
+    return f'id: {change["seq"]}\nevent: {change["op"]}\ndata: {serializers.dumps(change)}\n\n'
+
+
+class ChangeFeed:
+    """
+    Fans the change log out to the event streams open in this process.
+
+    A single background thread polls the log while at least one stream is open and keeps the newest
+    changes in memory, already encoded as events. Streams wait on a shared condition and copy the events
+    they have not sent yet from that buffer, so an open connection costs no query and no serialization:
+    with hundreds of clients the database still sees one small primary key range read per poll interval.
+
+    Args:
+        app: The Flask app, the poller and the backfill reads run in its app context.
+        poll_interval (float): Seconds between two reads of the log.
+        buffer_size (int): Number of recent events kept in memory.
+        batch_size (int): Maximum number of changes read by one query.
+
+    Notes:
+        - A client resuming from a seq older than the buffer (e.g. after a long disconnect) first reads the
+          missing changes straight from the log, batch_size at a time, then joins the shared buffer.
+        - Nothing is polled while no stream is open. The buffer starts over from the newest change when the
+          first stream of an idle process subscribes.
+        - Changes made by other worker processes are seen too, since they all go through the log.
+    """
+
+    def __init__(self, app, poll_interval=1.0, buffer_size=1000, batch_size=500):
+        self.app = app
+        self.poll_interval = poll_interval
+        self.buffer_size = buffer_size
+        self.batch_size = batch_size
+        self.buffer = []  # (seq, event) tuples, oldest first
+        self.buffer_start = 0  # the buffer holds every change after this seq
+        self.last_seq = 0  # the newest change read by the poller
+        self.subscribers = 0
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def events(self, since=None, timeout=15):
+        """
+        Yields the events of the changes after seq `since`, as they are committed.
+
+        Args:
+            since (int): The last seq the client has seen, None to only send changes made from now on.
+            timeout (float): Yields None after this many seconds without changes, so the caller can send a
+                keep-alive and notice closed connections.
+        """
+        self._subscribe()
+        try:
+            cursor = self.last_seq if since is None else since
+            while True:
+                with self._condition:
+                    self._condition.wait_for(lambda: self._has_events(cursor), timeout)
+                    events, buffer_start = self._buffered(cursor), self.buffer_start
+
+                if events is None:
+                    # behind the buffer: catch up from the log itself
+                    with self.app.app_context():
+                        events = encode_events(read_changes(cursor, self.batch_size))
+                    if not events:  # the missing changes were pruned
+                        cursor = buffer_start
+                        continue
+
+                if not events:
+                    yield None
+                for seq, event in events:
+                    yield event
+                    cursor = seq
+        finally:
+            with self._condition:
+                self.subscribers -= 1
+
+    def _subscribe(self):
+        with self._condition:
+            if not self.subscribers:
+                with self.app.app_context():
+                    self._reset(latest_seq())
+            self.subscribers += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._poll, name='change-feed', daemon=True)
+                self._thread.start()
+            self._condition.notify_all()
+
+    def _poll(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self.subscribers)
+                since = self.last_seq
+
+            changes = []
+            with self.app.app_context():
+                try:
+                    changes = read_changes(since, self.batch_size)
+                except Exception:
+                    self.app.logger.exception('Reading the bug change log failed')
+
+            with self._condition:
+                if self._extend(since, changes):
+                    self._condition.notify_all()
+
+            if len(changes) < self.batch_size:
+                time.sleep(self.poll_interval)
+
+    # The buffer bookkeeping below is shared with the asyncio feed of website.asgi, callers hold the lock.
+
+    def _reset(self, seq):
+        """Empties the buffer, the next change expected being the one after seq."""
+        self.buffer = []
+        self.last_seq = self.buffer_start = seq
+
+    def _has_events(self, cursor):
+        return self.last_seq > cursor or cursor < self.buffer_start
+
+    def _buffered(self, cursor):
+        """The buffered events after seq cursor, None when the buffer does not reach back that far."""
+        if cursor < self.buffer_start:
+            return None
+        return self.buffer[bisect_right(self.buffer, cursor, key=_event_seq):]
+
+    def _extend(self, since, changes):
+        """Buffers the changes read after seq since. Returns False when there is nothing new to announce."""
+        if not changes or since != self.last_seq:  # the buffer was reset while reading
+            return False
+        self.buffer.extend(encode_events(changes))
+        self.last_seq = changes[-1]['seq']
+        excess = len(self.buffer) - self.buffer_size
+        if excess > 0:
+            self.buffer_start = self.buffer[excess - 1][0]
+            del self.buffer[:excess]
+        return True
+
+
+def encode_events(changes):
+    """The (seq, event) tuples of the changes, as kept in the buffer of the feeds."""
+    return [(change['seq'], format_event(change)) for change in changes]
+
+
+def _event_seq(event):
+    return event[0]
+
+
+def prune_changes(before):
+    """
+    Deletes the change log entries older than a date.
+
+    Returns:
+        int: The number of deleted entries.
+
+    Notes:
+        - The newest entry is always kept: its seq is the data version of the response cache
+          (website.httpcache), which must never go back to a value it had before.
+    """
+    count = db.session.execute(delete(BugChange).where(
+        BugChange.changed_at < before, BugChange.seq < select_latest_seq().scalar_subquery()
+    )).rowcount
+    db.session.commit()
+    return count
+
+
+def init_app(app):
+    """
+    Creates the change feed of an app and registers `flask prune-changes`.
+
+    Config:
+        CHANGE_FEED_POLL_INTERVAL (float): Seconds between two reads of the change log, 1 by default.
+        CHANGE_FEED_BUFFER_SIZE (int): Recent changes kept in memory for the event streams, 1000 by default.
+        CHANGE_LOG_RETENTION_DAYS (int): Age after which `flask prune-changes` deletes entries, 30 by default.
+        CHANGE_STREAM_MAX_OPEN (int): Event streams served at once by the WSGI view of a process, 2 by
+            default. Each holds a server thread, keep it below the threads of a worker (gunicorn.conf.py).
+            The ASGI entry point (asgi.py) serves its streams on the event loop and has no limit.
+    """
+    app.extensions['change_feed'] = ChangeFeed(
+        app,
+        poll_interval=app.config.get('CHANGE_FEED_POLL_INTERVAL', 1.0),
+        buffer_size=app.config.get('CHANGE_FEED_BUFFER_SIZE', 1000),
+    )
+    app.extensions['change_stream_slots'] = threading.BoundedSemaphore(app.config.get('CHANGE_STREAM_MAX_OPEN', 2))
+
+    @app.cli.command('prune-changes')
+    @click.option('--days', type=int, default=None, help='Keep this many days of changes.')
+    def prune_changes_command(days):
+        """Delete old entries of the bug change log."""
+        if days is None:
+            days = app.config.get('CHANGE_LOG_RETENTION_DAYS', 30)
+        count = prune_changes(datetime.utcnow() - timedelta(days=days))
+        click.echo(f'{count} changes older than {days} days deleted.')
+
+    return app.extensions['change_feed']
@@ -0,0 +1,149 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from flask import current_app
+from werkzeug.exceptions import ServiceUnavailable
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+
+
+# werkzeug's scrypt defaults written out, this is the method string stored in front of every hash
+DEFAULT_METHOD = 'scrypt:32768:8:1'
+
+BUSY_MESSAGE = 'Too many password checks at the moment, please try again.'
+
+
+def full_method(method):
+    """
+    The method string werkzeug stores for a configured method, with its default parameters filled in.
+
+    'scrypt' is stored as 'scrypt:32768:8:1' and 'pbkdf2' as 'pbkdf2:sha256:<iterations>', so comparing the
+    configured method with the stored prefix as is would flag every hash for rehashing.
+    """
+    name, *args = method.split(':')
+    if name == 'scrypt' and not args:
+        return DEFAULT_METHOD
+    if name == 'pbkdf2' and len(args) < 2:
+        return f'pbkdf2:{args[0] if args else "sha256"}:{DEFAULT_PBKDF2_ITERATIONS}'
+    return method
+
+
+class PasswordHasher:
+    """
+    Hashes and checks passwords on a bounded pool of worker processes.
+
+    scrypt is deliberately slow and CPU bound. Run on the request thread, a burst of logins keeps every
+    web worker busy hashing and normal requests wait behind them. Here the hashing runs in `workers`
+    separate processes, at most `workers + queue_limit` hashes are in flight, and requests beyond that
+    are turned away with 503 Service Unavailable instead of piling up.
+
+    Args:
+        method (str): werkzeug hashing method with its cost parameters, e.g. 'scrypt:32768:8:1'.
+        workers (int): Number of hashing processes. 0 hashes on the request thread.
+        queue_limit (int): Hashes allowed to wait for a free process.
+        timeout (float): Seconds to wait for a result before giving up with a 503.
+
+    Notes:
+        - The hashing processes are started with forkserver (spawn where it is missing), which imports the
+          main module again: a script creating the app at module level and logging users in needs an
+          `if __name__ == '__main__':` guard, or PASSWORD_HASH_WORKERS = 0.
+    """
+
+    def __init__(self, method=DEFAULT_METHOD, workers=2, queue_limit=16, timeout=10):
+        self.method = full_method(method)
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers + queue_limit)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def hash(self, password):
+        """Returns the hash of a password, salted and prefixed with the configured method."""
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        """Checks a password against a stored hash, whatever the method the hash was made with."""
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """True if a stored hash was made with other cost parameters than the configured method."""
+        return pwhash.split('$', 1)[0] != self.method
+
+    def _run(self, function, *args):
+        if not self.workers:
+            return function(*args)
+        if not self._slots.acquire(blocking=False):
+            raise ServiceUnavailable(BUSY_MESSAGE, retry_after=1)
+        executor = self._get_executor()
+        try:
+            future = executor.submit(function, *args)
+        except BrokenProcessPool:
+            self._slots.release()
+            self._discard(executor)
+            raise ServiceUnavailable(BUSY_MESSAGE, retry_after=1)
+        except BaseException:
+            self._slots.release()
+            raise
+        # the slot is held until the hash is done, not until we stop waiting for it: a hash that timed out
+        # keeps its process busy, and counting it is what keeps the pool from being overcommitted
+        future.add_done_callback(lambda future: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()  # only stops a hash still waiting for a process
+            raise ServiceUnavailable(BUSY_MESSAGE, retry_after=1)
+        except BrokenProcessPool:
+            # a hashing process died (e.g. SIGKILL from the OOM killer) and the pool refuses any further work:
+            # replace it for the next calls, this one gets a 503 like any other failed attempt
+            self._discard(executor)
+            raise ServiceUnavailable(BUSY_MESSAGE, retry_after=1)
+
+    def _get_executor(self):
+        # created on first use, so every (forked) web worker process gets its own pool. The hashing processes
+        # are not forked from the web worker, whose other threads (requests, the change feed poller) may hold
+        # locks at that moment that the child would inherit locked.
+        with self._executor_lock:
+            if self._executor is None:
+                method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context(method))
+            return self._executor
+
+    def _discard(self, executor):
+        # only drop the pool if it is still the current one, another thread may already have replaced it
+        with self._executor_lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
+
+
+def hasher():
+    """The PasswordHasher of the current app."""
+    return current_app.extensions['password_hasher']
+
+
+def init_app(app):
+    """
+    Creates the password hasher of an app.
+
+    Config:
+        PASSWORD_HASH_METHOD (str): werkzeug method and cost, DEFAULT_METHOD by default. Hashes made with
+            another method are replaced on the next successful login.
+        PASSWORD_HASH_WORKERS (int): Hashing processes, up to 2 by default. 0 hashes on the request thread.
+        PASSWORD_HASH_QUEUE_LIMIT (int): Hashes that can wait for a process before logins get a 503, 16 by default.
+        PASSWORD_HASH_TIMEOUT (float): Seconds to wait for a hash, 10 by default.
+    """
+    app.extensions['password_hasher'] = PasswordHasher(
+        method=app.config.get('PASSWORD_HASH_METHOD', DEFAULT_METHOD),
+        workers=app.config.get('PASSWORD_HASH_WORKERS', min(2, os.cpu_count() or 1)),
+        queue_limit=app.config.get('PASSWORD_HASH_QUEUE_LIMIT', 16),
+        timeout=app.config.get('PASSWORD_HASH_TIMEOUT', 10),
+    )
+    return app.extensions['password_hasher']
@@ -0,0 +1,102 @@
+import hashlib
+from functools import wraps
+from flask import current_app, request, session
+from flask_login import current_user
+from . import changes, storage
+from .cache import MemoryCache
+
+
+# Where the version of each scope is read: a query returning a number that grows with every write to the
+# data behind it. The change log is appended to by triggers in the transaction of every write to a bug, from
+# any process, so its newest seq is a version shared by all the workers.
+SCOPES = {
+    'bugs': changes.select_latest_seq,
+}
+
+
+class ResponseCache:
+    """
+    Serialized responses of the list endpoints, keyed by data version.
+
+    Every cached view depends on one or more scopes, e.g. 'bugs' for anything showing bugs, whose version
+    is read from the database (see SCOPES) before the view runs. A response is cached under (endpoint,
+    user, query args, versions of its scopes), so a write makes the old entries unreachable instead of
+    having to find and delete them, whichever process or job committed it.
+
+    Args:
+        backend: Object with get(key), set(key, value, ttl=None) and delete(key), e.g. a MemoryCache.
+        ttl (float): Seconds an entry is kept, passed to every set() so a shared backend expires them too.
+
+    Notes:
+        - Reading a version is a single max() answered from the end of a primary key, much cheaper than
+          the queries and serialization a hit saves.
+        - The ETag is a hash of the body, so it stays valid across processes and restarts: a client that
+          sends it back gets 304 Not Modified as long as the content is the same.
+    """
+
+    def __init__(self, backend, ttl=5):
+        self.backend = backend
+        self.ttl = ttl
+
+    def versions(self, scopes):
+        """The current versions of the scopes, 0 for one with no data yet."""
+        return tuple(storage.read(SCOPES[scope]()).scalar() or 0 for scope in scopes)
+
+
+def cached_response(*scopes):
+    """
+    Caches the 200 responses of a view and answers conditional GETs.
+
+    Args:
+        *scopes (str): The data the view shows, e.g. cached_response('bugs').
+
+    Notes:
+        - A cache hit runs no query and no serialization, and If-None-Match with the current ETag
+          gets an empty 304 Not Modified.
+        - Streamed responses and pages with pending flash messages are passed through uncached.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            cache = current_app.extensions['response_cache']
+            if not current_app.config.get('RESPONSE_CACHE_ENABLED', True) or session.get('_flashes'):
+                return view(*args, **kwargs)
+
+            user_id = current_user.get_id()
+            versions = cache.versions(scopes)
+            key = (request.endpoint, user_id, tuple(sorted(request.args.items(multi=True))), kwargs, versions)
+            key = hashlib.sha1(repr(key).encode()).hexdigest()
+
+            entry = cache.backend.get(key)
+            if entry is None:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                body = response.get_data()
+                entry = (hashlib.sha1(body).hexdigest(), body, response.mimetype)
+                cache.backend.set(key, entry, ttl=cache.ttl)
+            else:
+                response = current_app.response_class(entry[1], mimetype=entry[2])
+
+            response.set_etag(entry[0])
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
+
+
+def init_app(app):
+    """
+    Creates the response cache of an app.
+
+    Config:
+        RESPONSE_CACHE_ENABLED (bool): True by default.
+        RESPONSE_CACHE_BACKEND: Shared cache client to use, a process-local MemoryCache by default.
+        RESPONSE_CACHE_TTL (float): Seconds a response stays cached, 5 by default.
+        RESPONSE_CACHE_SIZE (int): Maximum number of responses in the MemoryCache, 512 by default.
+    """
+    ttl = app.config.get('RESPONSE_CACHE_TTL', 5)
+    backend = app.config.get('RESPONSE_CACHE_BACKEND') or MemoryCache(
+        max_entries=app.config.get('RESPONSE_CACHE_SIZE', 512), ttl=ttl
+    )
+    app.extensions['response_cache'] = ResponseCache(backend, ttl)
+    return app.extensions['response_cache']
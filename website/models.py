@@ -1,9 +1,28 @@
 from . import db
 from flask_login import UserMixin
+from sqlalchemy import Integer, literal_column
 from sqlalchemy.sql import func
 from datetime import datetime
 
 
+# Values offered by the bug form. The API accepts any string, these are the ones the search box expands to.
+BUG_STATUSES = ('Open', 'In Progress', 'Resolved')
+BUG_PRIORITIES = ('Low', 'Medium', 'High')
+
+
+def _rank(column, ranks, other):
+    whens = ' '.join(f"WHEN '{value}' THEN {rank}" for value, rank in ranks.items())
+    return literal_column(f'CASE {column} {whens} ELSE {other} END', Integer)
+
+
+# Sort keys of the dashboard's priority and status orders, both sorted descending: High first, Open first, and
+# values outside the form's lists first (priority) or last (status). Written out with inline literals because
+# sqlite only uses an index on an expression (see Bug) for the very same expression, bound parameters differ.
+PRIORITY_RANK = _rank('priority', {value: rank for rank, value in enumerate(BUG_PRIORITIES, 1)},
+                      len(BUG_PRIORITIES) + 1)
+STATUS_RANK = _rank('status', {value: len(BUG_STATUSES) - rank for rank, value in enumerate(BUG_STATUSES)}, 0)
+
+
 # Define the Bug model
 class Bug(db.Model):
     """
@@ -17,6 +36,7 @@ class Bug(db.Model):
         priority (str): The priority level assigned to the bug (non-nullable).
         date_created (datetime): The date and time when the bug was created (non-nullable).
         user_id (int): The user identifier associated with the bug report (foreign key, non-nullable).
+        version (int): Incremented by every update, for the optimistic locking of PATCH /bugs/<id> (non-nullable).
 
     Relationships:
         - 'user': The user who reported this bug.
@@ -24,7 +44,8 @@ class Bug(db.Model):
     Notes:
         - This class represents a bug report in the application's database.
         - It inherits from 'db.Model', indicating it's an SQLAlchemy model.
-        - The 'id' field is an auto-incremented integer primary key.
+        - The 'id' field is an auto-incremented integer primary key. AUTOINCREMENT keeps the ids of archived
+          bugs from being handed out again, an id is either in bug or in bug_archive (see website.archive).
         - 'title' is a short, descriptive title or summary of the bug.
         - 'description' provides a more detailed description of the bug.
         - 'status' represents the current status of the bug (e.g., 'Open', 'In Progress', 'Resolved').
@@ -32,15 +53,86 @@ class Bug(db.Model):
         - 'date_created' records the date and time when the bug report was created.
         - 'user_id' is a foreign key linking the bug report to the user who reported it.
         - The 'user' relationship allows accessing the user associated with this bug.
+        - The indexes cover the filters the blueprints use: bugs of a user (newest first on the dashboard,
+          and all of them on account deletion), search by status, priority or creation date. The status index
+          also carries date_created, so the /bugs/facets counts are computed from the index alone.
+        - The dashboard's priority and status orders have an index each on (user_id, rank, date_created), so
+          every page is read from where the previous one ended (see views._dashboard_page).
     """
+    __table_args__ = (
+        db.Index('ix_bug_user_id_date_created', 'user_id', 'date_created'),
+        db.Index('ix_bug_status_priority_date_created', 'status', 'priority', 'date_created'),
+        db.Index('ix_bug_priority', 'priority'),
+        db.Index('ix_bug_date_created', 'date_created'),
+        db.Index('ix_bug_user_id_priority_rank', 'user_id', PRIORITY_RANK, 'date_created'),
+        db.Index('ix_bug_user_id_status_rank', 'user_id', STATUS_RANK, 'date_created'),
+        {'sqlite_autoincrement': True},
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text, nullable=False)
     status = db.Column(db.String(20), nullable=False)
     priority = db.Column(db.String(20), nullable=False)
     date_created = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    version = db.Column(db.Integer, default=1, server_default='1', nullable=False)
+
+
 
+class BugArchive(db.Model):
+    """
+    A resolved bug moved out of the bug table by `flask archive-bugs`, see website.archive.
+
+    Attributes:
+        id (int): The id the bug had in the bug table, kept so links and the change log still point to it.
+        title, description, status, priority, date_created, user_id, version: As in Bug, at archival time.
+        archived_at (datetime): When the bug was moved to the archive, in UTC.
+
+    Notes:
+        - Archived bugs are only read by /json and /search with include_archived, the dashboard and the
+          other endpoints only see the bug table. That keeps the hot table and its indexes small.
+        - The only index is the one on user_id, for the cascade of account deletions. Searches that include
+          the archive read it in full, which is the price of opting into the cold tier.
+    """
+    __tablename__ = 'bug_archive'
+    __table_args__ = (
+        db.Index('ix_bug_archive_user_id', 'user_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    title = db.Column(db.String(100), nullable=False)
+    description = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    priority = db.Column(db.String(20), nullable=False)
+    date_created = db.Column(db.DateTime, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    version = db.Column(db.Integer, server_default='1', nullable=False)
+    archived_at = db.Column(db.DateTime, nullable=False, server_default=func.current_timestamp())
+
+
+class BugStats(db.Model):
+    """
+    Number of bugs of a user per status and priority, served by /stats.
+
+    Attributes:
+        user_id (int): The reporter of the bugs.
+        status (str): Their status.
+        priority (str): Their priority.
+        count (int): How many bugs of the user have this status and priority, archived ones included.
+
+    Notes:
+        - Rows are only written by the triggers of website.schema, in the same transaction as the write to
+          the bug table. Rows dropping to 0 are deleted, so the table never has more rows than there are
+          (user, status, priority) combinations in use.
+        - `flask rebuild-stats` recomputes the table from bug and bug_archive if it ever drifts.
+    """
+    __tablename__ = 'bug_stats'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    priority = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.Integer, nullable=False)
 
 #define user model 
 class User(db.Model, UserMixin):
@@ -67,14 +159,49 @@ class User(db.Model, UserMixin):
         - 'password' stores the user's hashed password, ensuring security.
         - The 'bugs' relationship is used to access bugs created by this user.
         - Lazy loading is enabled for the 'bugs' relationship, meaning that bugs are loaded only when accessed.
+        - Deleting a user does not load their bugs (passive_deletes): the database removes them through
+          ON DELETE CASCADE. Databases created before the cascade was declared rely on website.purge instead,
+          which deletes the bugs with set-based DELETE statements first.
     """
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(100), unique=True, nullable=False)
     username = db.Column(db.String(150), nullable=False)
     password = db.Column(db.String(100), nullable=False) 
-    bugs = db.relationship('Bug', backref='user', lazy=True)
+    bugs = db.relationship('Bug', backref='user', lazy=True, passive_deletes=True)
     
 
     
 
-    
\ No newline at end of file
+    
+
+class BugChange(db.Model):
+    """
+    An entry of the bug change log, read by /bugs/changes and the /bugs/changes/stream event stream.
+
+    Attributes:
+        seq (int): Position of the change in the log, increasing with every write to the bug table.
+        op (str): 'create', 'update', 'delete' or 'archive' (moved to the bug_archive table).
+        bug_id (int): The id of the changed bug. Not a foreign key, deleted bugs keep their entries.
+        user_id (int): The reporter of the bug.
+        title (str): The title of the bug after the change (before it for 'delete' and 'archive').
+        status (str): The status of the bug after the change (before it for 'delete' and 'archive').
+        priority (str): The priority of the bug after the change (before it for 'delete' and 'archive').
+        changed_at (datetime): When the change was committed, in UTC.
+
+    Notes:
+        - Rows are only written by the triggers of website.schema, in the same transaction as the write
+          to the bug table, so every committed write has exactly one entry and rolled back ones have none.
+        - AUTOINCREMENT keeps seq from reusing the numbers of pruned entries, so a client resuming from
+          an old seq never misses changes because of `flask prune-changes`.
+    """
+    __tablename__ = 'bug_change'
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    seq = db.Column(db.Integer, primary_key=True)
+    op = db.Column(db.String(10), nullable=False)
+    bug_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer)
+    title = db.Column(db.String(100))
+    status = db.Column(db.String(20))
+    priority = db.Column(db.String(20))
+    changed_at = db.Column(db.DateTime, nullable=False, server_default=func.current_timestamp())
@@ -0,0 +1,247 @@
+import cProfile
+import os
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from flask import Response, g, has_request_context, request, before_render_template, template_rendered
+from sqlalchemy import event
+from . import db
+
+
+# Upper bounds of the request duration histogram, in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Totals kept per endpoint, exported as bugtracker_<name>
+COUNTERS = {
+    'sql_statements_total': 'SQL statements executed.',
+    'sql_duration_seconds_total': 'Time spent executing SQL statements.',
+    'rows_total': 'Rows loaded as model instances or serialized for the API.',
+    'serialization_seconds_total': 'Time spent encoding JSON responses.',
+    'template_render_seconds_total': 'Time spent rendering templates.',
+    'n_plus_one_total': 'Requests that ran the same SELECT N_PLUS_ONE_THRESHOLD times or more.',
+}
+
+
+class RequestProfile:
+    """What one request spent its time on, collected while it runs and added to the Profiler at the end."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+        self.rows = 0
+        self.serialization_seconds = 0.0
+        self.template_seconds = 0.0
+        self.statements = Counter()  # SELECT text -> executions, to spot N+1 patterns
+        self.template_started = []
+        self.cprofile = None
+        self.streamed = False
+
+
+class Profiler:
+    """
+    Per-endpoint aggregates of the request profiles, rendered for Prometheus by /metrics.
+
+    Args:
+        n_plus_one_threshold (int): Executions of one SELECT within a request that count as an N+1 pattern.
+        cprofile_routes (dict): Endpoint -> fraction of its requests to run under cProfile, e.g.
+            {'views.search_bug': 0.05}.
+        cprofile_dir (str): Where the sampled profiles are written, one .prof file per request.
+    """
+
+    def __init__(self, n_plus_one_threshold=5, cprofile_routes=None, cprofile_dir=None):
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.cprofile_routes = cprofile_routes or {}
+        self.cprofile_dir = cprofile_dir
+        self.requests = Counter()
+        self.duration_sum = Counter()
+        self.duration_buckets = defaultdict(lambda: [0] * len(DURATION_BUCKETS))
+        self.totals = defaultdict(Counter)  # counter name -> endpoint -> value
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, profile, duration):
+        """Adds a finished request to the aggregates. Returns the statements that look like N+1 queries."""
+        repeated = [statement for statement, count in profile.statements.items() if count >= self.n_plus_one_threshold]
+        with self._lock:
+            self.requests[endpoint] += 1
+            self.duration_sum[endpoint] += duration
+            buckets = self.duration_buckets[endpoint]
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    buckets[index] += 1
+            self.totals['sql_statements_total'][endpoint] += profile.sql_statements
+            self.totals['sql_duration_seconds_total'][endpoint] += profile.sql_seconds
+            self.totals['rows_total'][endpoint] += profile.rows
+            self.totals['serialization_seconds_total'][endpoint] += profile.serialization_seconds
+            self.totals['template_render_seconds_total'][endpoint] += profile.template_seconds
+            self.totals['n_plus_one_total'][endpoint] += bool(repeated)
+        return repeated
+
+    def render(self, user_cache_stats=None):
+        """The aggregates in the Prometheus text exposition format."""
+        lines = [
+            '# HELP bugtracker_request_duration_seconds Wall time of the requests, streaming included.',
+            '# TYPE bugtracker_request_duration_seconds histogram',
+        ]
+        with self._lock:
+            for endpoint in sorted(self.requests):
+                label = f'endpoint="{endpoint}"'
+                for bound, count in zip(DURATION_BUCKETS, self.duration_buckets[endpoint]):
+                    lines.append(f'bugtracker_request_duration_seconds_bucket{{{label},le="{bound}"}} {count}')
+                lines.append(f'bugtracker_request_duration_seconds_bucket{{{label},le="+Inf"}} {self.requests[endpoint]}')
+                lines.append(f'bugtracker_request_duration_seconds_sum{{{label}}} {self.duration_sum[endpoint]:.6f}')
+                lines.append(f'bugtracker_request_duration_seconds_count{{{label}}} {self.requests[endpoint]}')
+            for name, help_text in COUNTERS.items():
+                lines.append(f'# HELP bugtracker_{name} {help_text}')
+                lines.append(f'# TYPE bugtracker_{name} counter')
+                for endpoint in sorted(self.requests):
+                    lines.append(f'bugtracker_{name}{{endpoint="{endpoint}"}} {self.totals[name][endpoint]:g}')
+        for name, value in (user_cache_stats or {}).items():
+            lines.append(f'# TYPE bugtracker_user_cache_{name}_total counter')
+            lines.append(f'bugtracker_user_cache_{name}_total {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def current():
+    """The RequestProfile of the current request, None when profiling is off or outside of a request."""
+    return g.get('_profile') if has_request_context() else None
+
+
+def add_rows(count):
+    """Counts rows handed to the API or the templates by code that reads them with Core selects."""
+    profile = current()
+    if profile is not None:
+        profile.rows += count
+
+
+@contextmanager
+def timing_serialization():
+    """Adds the time spent in the block to the serialization time of the current request."""
+    profile = current()
+    if profile is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.serialization_seconds += time.perf_counter() - started
+
+
+def _count_loaded_instance(target, context):
+    add_rows(1)
+
+
+def init_app(app):
+    """
+    Installs the request profiling of an app when PROFILING_ENABLED is set.
+
+    Every request then records its wall time, number and duration of SQL statements, rows, serialization
+    time and template render time. The totals per endpoint are served at /metrics for Prometheus, along
+    with the hit/miss counters of the user cache. SELECTs repeated within one request are logged as
+    probable N+1 queries.
+
+    Config:
+        PROFILING_ENABLED (bool): False by default, nothing is installed and nothing is measured.
+        PROFILING_METRICS_PATH (str): URL of the metrics, '/metrics' by default. Not behind login, keep it
+            off the public network.
+        PROFILING_N_PLUS_ONE_THRESHOLD (int): Executions of one SELECT within a request to flag, 5 by default.
+        PROFILING_CPROFILE_ROUTES (dict): Endpoint -> fraction of its requests to run under cProfile.
+        PROFILING_CPROFILE_DIR (str): Where the .prof files go, 'profiles' in the instance folder by default.
+            Read them with `python -m pstats <file>` or snakeviz.
+
+    Returns:
+        Profiler: The profiler, also available as app.extensions['profiler'], or None when disabled.
+    """
+    if not app.config.get('PROFILING_ENABLED'):
+        return None
+
+    profiler = app.extensions['profiler'] = Profiler(
+        n_plus_one_threshold=app.config.get('PROFILING_N_PLUS_ONE_THRESHOLD', 5),
+        cprofile_routes=app.config.get('PROFILING_CPROFILE_ROUTES'),
+        cprofile_dir=app.config.get('PROFILING_CPROFILE_DIR') or os.path.join(app.instance_path, 'profiles'),
+    )
+    metrics_path = app.config.get('PROFILING_METRICS_PATH', '/metrics')
+
+    @app.before_request
+    def start_profile():
+        if request.path == metrics_path:
+            return
+        profile = g._profile = RequestProfile()
+        if random.random() < profiler.cprofile_routes.get(request.endpoint, 0):
+            profile.cprofile = cProfile.Profile()
+            profile.cprofile.enable()
+
+    def finish(endpoint, profile):
+        duration = time.perf_counter() - profile.started
+        if profile.cprofile is not None:
+            profile.cprofile.disable()
+            os.makedirs(profiler.cprofile_dir, exist_ok=True)
+            profile.cprofile.dump_stats(os.path.join(
+                profiler.cprofile_dir, f'{endpoint}-{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}-{id(profile)}.prof'
+            ))
+        for statement in profiler.record(endpoint, profile, duration):
+            app.logger.warning('Possible N+1 query on %s, ran %d times: %s',
+                               endpoint, profile.statements[statement], ' '.join(statement.split()))
+
+    @app.after_request
+    def defer_streamed_profile(response):
+        # a streamed body is generated after the request has been torn down, the profile is finished when
+        # the server closes the response so that the streaming is part of the numbers
+        profile = g.get('_profile')
+        if profile is not None and response.is_streamed:
+            profile.streamed = True
+            endpoint = request.endpoint
+            response.call_on_close(lambda: finish(endpoint, profile))
+        return response
+
+    @app.teardown_request
+    def finish_profile(exception=None):
+        profile = g.get('_profile')
+        if profile is not None and not profile.streamed:
+            g.pop('_profile')
+            finish(request.endpoint or 'unmatched', profile)
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if current() is not None:
+            conn.info.setdefault('profiling_started', []).append(time.perf_counter())
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        profile = current()
+        if profile is None or not conn.info.get('profiling_started'):
+            return
+        profile.sql_seconds += time.perf_counter() - conn.info['profiling_started'].pop()
+        profile.sql_statements += 1
+        if statement.lstrip()[:6].upper() == 'SELECT':
+            profile.statements[statement] += 1
+
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+
+    if not event.contains(db.Model, 'load', _count_loaded_instance):  # once for all the apps of the process
+        event.listen(db.Model, 'load', _count_loaded_instance, propagate=True)
+
+    def template_started(sender, template, context, **extra):
+        profile = current()
+        if profile is not None:
+            profile.template_started.append(time.perf_counter())
+
+    def template_finished(sender, template, context, **extra):
+        profile = current()
+        if profile is not None and profile.template_started:
+            profile.template_seconds += time.perf_counter() - profile.template_started.pop()
+
+    before_render_template.connect(template_started, app, weak=False)
+    template_rendered.connect(template_finished, app, weak=False)
+
+    def metrics():
+        user_cache = app.extensions.get('user_cache')
+        body = profiler.render(user_cache.stats() if user_cache else None)
+        return Response(body, mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule(metrics_path, 'metrics', metrics)
+    return profiler
@@ -0,0 +1,157 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import click
+from flask import current_app
+from sqlalchemy import select, delete
+from . import db
+from .models import Bug, User
+
+
+# Accounts waiting for the background purge get this email, so the address can be used to sign up again
+PURGE_EMAIL_PREFIX = 'deleted:'
+# Stored instead of a password hash while the account is being purged, no password matches it
+DISABLED_PASSWORD = '!'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def has_more_bugs(user_id, limit):
+    """
+    Whether a user reported more than `limit` bugs.
+
+    Steps over at most `limit` entries of the (user_id, date_created) index and stops at the next one,
+    instead of counting every bug of a heavy account before the request can answer.
+    """
+    statement = select(Bug.id).where(Bug.user_id == user_id).offset(limit).limit(1)
+    return db.session.scalar(statement) is not None
+
+
+def delete_user_bugs(user_id, chunk_size=None):
+    """
+    Deletes every bug of a user.
+
+    Args:
+        user_id (int): The id of the user.
+        chunk_size (int): Delete and commit this many bugs at a time, so a huge account never holds the
+            write lock for long. None deletes everything with one statement in the current transaction.
+
+    Returns:
+        int: The number of deleted bugs.
+    """
+    if chunk_size is None:
+        return db.session.execute(
+            delete(Bug).where(Bug.user_id == user_id).execution_options(synchronize_session=False)
+        ).rowcount
+
+    deleted = 0
+    while True:
+        chunk = select(Bug.id).where(Bug.user_id == user_id).limit(chunk_size)
+        count = db.session.execute(
+            delete(Bug).where(Bug.id.in_(chunk)).execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        deleted += count
+        if count < chunk_size:
+            return deleted
+
+
+def delete_user(user_id, chunk_size=None):
+    """Deletes a user and all their bugs, see delete_user_bugs for chunk_size."""
+    delete_user_bugs(user_id, chunk_size)
+    db.session.execute(delete(User).where(User.id == user_id).execution_options(synchronize_session=False))
+    db.session.commit()
+
+
+def schedule_purge(user):
+    """
+    Disables an account and deletes it in the background.
+
+    The user can no longer log in and their email is freed as soon as this returns. The bugs are then
+    deleted in chunks of ACCOUNT_PURGE_CHUNK_SIZE by a background thread, followed by the user itself.
+    Purges interrupted by a restart (e.g. a gunicorn worker recycled after max_requests) are resumed by the
+    next process to serve a request, see init_app.
+
+    Args:
+        user (User): The account to delete, attached to the current session.
+    """
+    user.email = f'{PURGE_EMAIL_PREFIX}{user.id}'
+    user.password = DISABLED_PASSWORD
+    db.session.commit()
+    _submit(current_app._get_current_object(), user.id)
+
+
+def select_pending_purges():
+    """
+    A Core SELECT of the ids of the accounts disabled by schedule_purge and not deleted yet.
+
+    A range on the email instead of LIKE 'deleted:%', so sqlite reads it from the unique email index.
+    """
+    prefix_end = PURGE_EMAIL_PREFIX[:-1] + chr(ord(PURGE_EMAIL_PREFIX[-1]) + 1)
+    return select(User.id).where(User.email >= PURGE_EMAIL_PREFIX, User.email < prefix_end)
+
+
+def resume_purges(app):
+    """
+    Schedules the background purge of every account left disabled by an interrupted process.
+
+    Returns:
+        int: The number of purges scheduled.
+    """
+    with app.app_context():
+        user_ids = db.session.scalars(select_pending_purges()).all()
+    for user_id in user_ids:
+        _submit(app, user_id)
+    return len(user_ids)
+
+
+def _submit(app, user_id):
+    global _executor
+
+    # the thread is started by the process that serves requests, never by a gunicorn master before it forks
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='account-purge')
+    _executor.submit(_purge, app, user_id)
+
+
+def _purge(app, user_id):
+    with app.app_context():
+        try:
+            delete_user(user_id, app.config.get('ACCOUNT_PURGE_CHUNK_SIZE', 5000))
+        except Exception:
+            app.logger.exception('Purging account %s failed, run `flask purge-accounts` to retry', user_id)
+
+
+def init_app(app):
+    """
+    Resumes the interrupted purges and registers `flask purge-accounts`.
+
+    Config:
+        ACCOUNT_PURGE_RESUME (bool): On the first request of every process, schedule the purges left
+            unfinished by a process that stopped, True by default. Deleting a bug or an account twice is
+            harmless, so two workers resuming the same purge only duplicate work.
+    """
+    if app.config.get('ACCOUNT_PURGE_RESUME', True):
+        resumed = []
+        lock = threading.Lock()
+
+        @app.before_request
+        def resume_interrupted_purges():
+            if resumed:
+                return
+            with lock:
+                if not resumed:
+                    count = resume_purges(app)
+                    if count:
+                        app.logger.info('Resumed %d interrupted account purges', count)
+                    resumed.append(count)
+
+    @app.cli.command('purge-accounts')
+    def purge_accounts_command():
+        """Finish deleting accounts whose background purge was interrupted."""
+        user_ids = db.session.scalars(select_pending_purges()).all()
+        for user_id in user_ids:
+            delete_user(user_id, app.config.get('ACCOUNT_PURGE_CHUNK_SIZE', 5000))
+            click.echo(f'Purged account {user_id}')
+        click.echo(f'{len(user_ids)} accounts purged.')
@@ -0,0 +1,158 @@
+import os
+import tempfile
+import click
+from sqlalchemy import event
+from . import db
+
+
+# Requests replayed by `flask check-query-plans`. Every SELECT, UPDATE and DELETE they issue must be
+# answered through an index; add the new endpoint here when a blueprint gains a route that queries bugs.
+# A check can end with the plan steps it is allowed to scan with, for the queries that read everything on purpose.
+QUERY_PLAN_CHECKS = [
+    ('POST', '/login', {'email': 'planner@example.com', 'password': 'secret!1'}),
+    ('GET', '/', None),
+    ('GET', '/?sort=priority', None),
+    ('GET', '/bugs/rows?sort=newest&after=2023-09-09T14:30:00,2', None),
+    ('GET', '/bugs/rows?sort=priority&after=3,2023-09-09T14:30:00,2', None),
+    ('GET', '/bugs/rows?sort=status&after=3,2023-09-09T14:30:00,2', None),
+    ('GET', '/bugs/1', None),
+    ('GET', '/json?after=1&limit=2', None),
+    ('GET', '/json?fields=title,status&format=ndjson', None),
+    ('GET', '/json?after=1&limit=2&include_archived=1', None),
+    ('GET', '/search?keyword=ui&category=title', None),
+    ('GET', '/search?keyword=login&category=text', None),
+    ('GET', '/search?keyword=open&category=status', None),
+    ('GET', '/search?keyword=high&category=priority', None),
+    ('GET', '/search?keyword=2023-09-09 14:30:00&category=date_created', None),
+    ('GET', '/search?keyword=&category=date_created&from=2023-09-01&to=2023-09-30', None),
+    # the archive only has an index on user_id, searching it reads it in full (see views.search_bug)
+    ('GET', '/search?keyword=ui&category=title&include_archived=1', None, ('SCAN bug_archive',)),
+    ('GET', '/search?keyword=open&category=status&include_archived=1', None, ('SCAN bug_archive',)),
+    # counts every bug: reads the whole (status, priority, date_created) index but no row
+    ('GET', '/bugs/facets', None, ('SCAN bug USING COVERING INDEX ix_bug_status_priority_date_created',)),
+    ('GET', '/bugs/facets?status=Open&status=In Progress', None),
+    ('GET', '/bugs/facets?from=2023-09-01&to=2023-09-30', None),
+    ('GET', '/bugs/changes?since=1&limit=10', None),
+    ('GET', '/stats', None),
+    ('POST', '/bugs/batch', [{'title': 'Batch bug', 'description': 'Created in a batch.', 'status': 'Open',
+                              'priority': 'Low'}]),
+    ('PUT', '/bugs/1', {'title': 'UI bug', 'description': 'Updated', 'status': 'Resolved', 'priority': 'Low'}),
+    ('PATCH', '/bugs/1', {'status': 'In Progress', 'version': 2}),
+    ('PATCH', '/bugs/1', {'priority': 'High', 'version': 2}),  # stale version, looked up for the 409
+    ('DELETE', '/bugs/2', None),
+    ('PATCH', '/bugs/batch', [{'id': 1, 'status': 'Open'}, {'id': 3, 'priority': 'High'}]),
+    ('DELETE', '/bugs/batch', [3, 4]),
+    ('POST', '/update-username', {'new_username': 'planner2'}),
+    ('POST', '/confirm-delete', {'confirm': 'yes'}),
+]
+
+SAMPLE_BUGS = [
+    {'title': 'UI alignment issue', 'description': 'Elements are not aligned.', 'status': 'Open', 'priority': 'High'},
+    {'title': 'Login broken', 'description': 'Users are unable to log in.', 'status': 'In Progress', 'priority': 'Medium'},
+    {'title': 'Slow search', 'description': 'Searching takes seconds.', 'status': 'Resolved', 'priority': 'Low'},
+]
+
+
+def explain(connection, statement, parameters=()):
+    """
+    Runs EXPLAIN QUERY PLAN for a statement.
+
+    Returns:
+        list: The 'detail' column of every plan step, e.g. 'SEARCH bug USING INDEX ix_bug_priority (priority=?)'.
+    """
+    rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, tuple(parameters)).fetchall()
+    return [row[3] for row in rows]
+
+
+def full_scans(plan):
+    """
+    Returns the steps of a query plan that read a whole table.
+
+    Notes:
+        - 'SCAN bug_fts VIRTUAL TABLE ...' is a lookup in the full-text index, not a table scan.
+        - 'SCAN bug USING COVERING INDEX ...' still reads every row of the index, so it counts as a full scan.
+    """
+    return [detail for detail in plan if detail.startswith('SCAN ') and 'VIRTUAL TABLE' not in detail]
+
+
+def check_query_plans(app, checks=QUERY_PLAN_CHECKS):
+    """
+    Replays requests against an app and explains every query they issue.
+
+    Args:
+        app (Flask): An app created with create_app(). Its database gets a test user and sample bugs.
+        checks (list): (method, url, data) tuples, form data for the auth routes and JSON for the bug API,
+            optionally followed by the tuple of full scans allowed for that request.
+
+    Returns:
+        list: (method, url, statement, plan, allowed_scans) for every distinct statement, in the order they
+        were issued.
+    """
+    issued = []
+
+    def record_statement(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+            issued.append((statement, parameters))
+
+    with app.app_context():
+        engine = db.engine
+        engines = list(db.engines.values())  # includes the read-only engine of the GET endpoints
+
+    client = app.test_client()
+    client.post('/sign-up', data={
+        'email': 'planner@example.com', 'username': 'planner', 'password1': 'secret!1', 'password2': 'secret!1',
+    })
+    for bug in SAMPLE_BUGS:
+        client.post('/bugs', json=bug)
+
+    results = []
+    seen = set()
+    for listened in engines:
+        event.listen(listened, 'before_cursor_execute', record_statement)
+    try:
+        for method, url, data, *allowed in checks:
+            del issued[:]
+            if url.startswith('/bugs'):
+                response = client.open(url, method=method, json=data)
+            else:
+                response = client.open(url, method=method, data=data)
+            response.get_data()  # runs streamed responses to the end
+            for statement, parameters in issued:
+                if statement in seen:
+                    continue
+                seen.add(statement)
+                with engine.connect() as connection:
+                    plan = explain(connection, statement, parameters)
+                    results.append((method, url, statement, plan, allowed[0] if allowed else ()))
+    finally:
+        for listened in engines:
+            event.remove(listened, 'before_cursor_execute', record_statement)
+    return results
+
+
+def init_app(app):
+    @app.cli.command('check-query-plans')
+    def check_query_plans_command():
+        """Fail if any query issued by the blueprints falls back to a full table scan."""
+        from . import create_app
+
+        with tempfile.TemporaryDirectory() as directory:
+            scratch = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.join(directory, "plans.db")}'})
+            results = check_query_plans(scratch)
+            with scratch.app_context():
+                for engine in db.engines.values():
+                    engine.dispose()  # release the file before the directory is removed
+
+        failures = allowed = 0
+        for method, url, statement, plan, allowed_scans in results:
+            scans = [detail for detail in full_scans(plan) if detail not in allowed_scans]
+            failures += bool(scans)
+            allowed += bool(full_scans(plan)) and not scans
+            status = 'FAIL' if scans else 'scan' if full_scans(plan) else 'ok  '  # 'scan': an allowed one
+            click.echo(f'{status} {method} {url}')
+            click.echo(f'     {" ".join(statement.split())}')
+            for detail in plan:
+                click.echo(f'       {detail}')
+        click.echo(f'{len(results)} statements checked, {failures} full table scans, {allowed} allowed ones.')
+        if failures:
+            raise SystemExit(1)
@@ -0,0 +1,134 @@
+import math
+import threading
+import time
+from flask import request
+from werkzeug.exceptions import TooManyRequests
+from .cache import MemoryCache
+
+
+# Requests allowed per endpoint, checked before the view runs. 'ip' buckets are keyed by the client address,
+# 'account' buckets by the email posted in the form, so guessing the password of one account from many
+# addresses is throttled as well as one address trying many accounts.
+DEFAULT_RATE_LIMITS = {
+    'auth.login': {'ip': '20/minute', 'account': '5/minute', 'methods': ('POST',)},
+    'auth.sign_up': {'ip': '5/hour', 'methods': ('POST',)},
+}
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+def parse_rate(rate):
+    """
+    Turns '5/minute' into (5, 60): at most 5 requests in a row, refilled at 5 per 60 seconds.
+
+    Raises:
+        ValueError: For anything else than '<count>/<second|minute|hour|day>'.
+    """
+    count, _, period = rate.partition('/')
+    if period not in PERIODS or not count.isdigit() or int(count) < 1:
+        raise ValueError(f'Invalid rate limit {rate!r}, expected e.g. "5/minute"')
+    return int(count), PERIODS[period]
+
+
+class RateLimiter:
+    """
+    Token buckets per client address and per account, in front of the expensive endpoints.
+
+    Every bucket holds up to `count` tokens and refills at count/period tokens per second. A request
+    takes one token from each of its buckets and is answered with 429 Too Many Requests and a
+    Retry-After header when one of them is empty. The check runs before the view, so a rejected login
+    costs neither the user lookup nor the scrypt verification.
+
+    Args:
+        backend: Object with get(key) and set(key, value, ttl=None) holding the buckets, e.g. a MemoryCache.
+        limits (dict): Endpoint -> {'ip': rate, 'account': rate, 'methods': (...)}, see DEFAULT_RATE_LIMITS.
+            Without 'methods' every method of the endpoint is limited.
+
+    Notes:
+        - Buckets are (tokens, timestamp) pairs that expire once they would be full again, so idle clients
+          take no room in the store.
+        - With a shared backend the read-modify-write of a bucket is atomic within a process only. Concurrent
+          requests from several workers can occasionally both take the last token, which is fine for throttling.
+        - The address is request.remote_addr. Behind a reverse proxy, wrap the app in werkzeug's ProxyFix so it
+          is the client's address and not the proxy's.
+    """
+
+    def __init__(self, backend, limits):
+        self.backend = backend
+        self.limits = {
+            endpoint: {kind: parse_rate(rate) for kind, rate in rules.items() if kind != 'methods'}
+            for endpoint, rules in limits.items()
+        }
+        self.methods = {endpoint: rules.get('methods') for endpoint, rules in limits.items()}
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def take(self, key, count, period):
+        """Takes a token from a bucket. Returns 0 if there was one, else the seconds until there is."""
+        refill = count / period
+        with self._lock:
+            now = time.time()  # wall clock, so buckets in a shared store mean the same thing in every process
+            tokens, updated = self.backend.get(key) or (count, now)
+            tokens = min(count, tokens + (now - updated) * refill)
+            if tokens < 1:
+                self.rejected += 1
+                return math.ceil((1 - tokens) / refill)
+            self.backend.set(key, (tokens - 1, now), ttl=period)
+            return 0
+
+    def check(self, endpoint, method, identities):
+        """
+        Takes a token from every bucket of a request.
+
+        Args:
+            identities (dict): Kind -> value, e.g. {'ip': '10.0.0.1', 'account': 'jane@example.com'}.
+                Kinds without a value (no email posted) are not limited.
+
+        Raises:
+            TooManyRequests: When a bucket is empty, with the seconds to wait as retry_after.
+        """
+        methods = self.methods.get(endpoint)
+        if endpoint not in self.limits or (methods and method not in methods):
+            return
+        for kind, (count, period) in self.limits[endpoint].items():
+            value = identities.get(kind)
+            if not value:
+                continue
+            retry_after = self.take(f'ratelimit:{endpoint}:{kind}:{value}', count, period)
+            if retry_after:
+                raise TooManyRequests('Too many attempts, please wait before trying again.', retry_after=retry_after)
+
+
+def init_app(app):
+    """
+    Creates the rate limiter of an app and checks it before every request.
+
+    Config:
+        RATE_LIMIT_ENABLED (bool): True by default.
+        RATE_LIMITS (dict): Limits per endpoint, DEFAULT_RATE_LIMITS by default. An endpoint mapped to {}
+            is not limited.
+        RATE_LIMIT_BACKEND: Shared cache client to keep the buckets in, a process-local MemoryCache by default.
+            With several workers each one then has its own buckets, which multiplies the limits by the number
+            of workers.
+        RATE_LIMIT_STORE_SIZE (int): Maximum number of buckets in the MemoryCache, 100000 by default.
+
+    Returns:
+        RateLimiter: The limiter, also available as app.extensions['rate_limiter'], or None when disabled.
+    """
+    if not app.config.get('RATE_LIMIT_ENABLED', True):
+        return None
+
+    backend = app.config.get('RATE_LIMIT_BACKEND') or MemoryCache(
+        max_entries=app.config.get('RATE_LIMIT_STORE_SIZE', 100000)
+    )
+    limiter = app.extensions['rate_limiter'] = RateLimiter(backend, app.config.get('RATE_LIMITS', DEFAULT_RATE_LIMITS))
+
+    @app.before_request
+    def check_rate_limits():
+        email = request.form.get('email') if request.method == 'POST' else None
+        limiter.check(request.endpoint, request.method, {
+            'ip': request.remote_addr,
+            'account': email.strip().lower() if email else None,
+        })
+
+    return limiter
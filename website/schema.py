@@ -0,0 +1,335 @@
+from sqlalchemy import text
+from . import db, search
+
+
+# Version 1, frozen: the schema as it was when versioning was introduced, written out instead of derived from
+# the models, so changing a model or a trigger later cannot change what this migration does. Every
+# statement skips what exists, version 1 also upgrades the databases created before the schema was versioned.
+V1_TABLES = [
+    """CREATE TABLE IF NOT EXISTS user (
+        id INTEGER NOT NULL,
+        email VARCHAR(100) NOT NULL,
+        username VARCHAR(150) NOT NULL,
+        password VARCHAR(100) NOT NULL,
+        PRIMARY KEY (id),
+        UNIQUE (email)
+    )""",
+    """CREATE TABLE IF NOT EXISTS bug (
+        id INTEGER NOT NULL,
+        title VARCHAR(100) NOT NULL,
+        description TEXT NOT NULL,
+        status VARCHAR(20) NOT NULL,
+        priority VARCHAR(20) NOT NULL,
+        date_created DATETIME NOT NULL,
+        user_id INTEGER NOT NULL,
+        version INTEGER DEFAULT '1' NOT NULL,
+        PRIMARY KEY (id),
+        FOREIGN KEY(user_id) REFERENCES user (id) ON DELETE CASCADE
+    )""",
+    """CREATE TABLE IF NOT EXISTS bug_change (
+        seq INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+        op VARCHAR(10) NOT NULL,
+        bug_id INTEGER NOT NULL,
+        user_id INTEGER,
+        title VARCHAR(100),
+        status VARCHAR(20),
+        priority VARCHAR(20),
+        changed_at DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS bug_archive (
+        id INTEGER NOT NULL,
+        title VARCHAR(100) NOT NULL,
+        description TEXT NOT NULL,
+        status VARCHAR(20) NOT NULL,
+        priority VARCHAR(20) NOT NULL,
+        date_created DATETIME NOT NULL,
+        user_id INTEGER NOT NULL,
+        version INTEGER DEFAULT '1' NOT NULL,
+        archived_at DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL,
+        PRIMARY KEY (id),
+        FOREIGN KEY(user_id) REFERENCES user (id) ON DELETE CASCADE
+    )""",
+    """CREATE TABLE IF NOT EXISTS bug_stats (
+        user_id INTEGER NOT NULL,
+        status VARCHAR(20) NOT NULL,
+        priority VARCHAR(20) NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (user_id, status, priority),
+        FOREIGN KEY(user_id) REFERENCES user (id) ON DELETE CASCADE
+    )""",
+]
+
+# columns added to the models before the schema was versioned, CREATE TABLE IF NOT EXISTS does not alter
+# the tables of those databases
+V1_ADDED_COLUMNS = {'bug': {'version': 'INTEGER NOT NULL DEFAULT 1'}}
+
+V1_BUG_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS ix_bug_priority ON bug (priority)',
+    'CREATE INDEX IF NOT EXISTS ix_bug_status_priority_date_created ON bug (status, priority, date_created)',
+    'CREATE INDEX IF NOT EXISTS ix_bug_date_created ON bug (date_created)',
+    'CREATE INDEX IF NOT EXISTS ix_bug_user_id_date_created ON bug (user_id, date_created)',
+]
+V1_INDEXES = V1_BUG_INDEXES + ['CREATE INDEX IF NOT EXISTS ix_bug_archive_user_id ON bug_archive (user_id)']
+
+# External content FTS5 index over bug.title and bug.description (see website.search), kept in sync with every
+# write to the bug table by the triggers, whichever code path issues it
+V1_FTS_TABLE = """CREATE VIRTUAL TABLE IF NOT EXISTS bug_fts USING fts5(
+        title, description, content='bug', content_rowid='id', prefix='2 3'
+    )"""
+V1_FTS_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS bug_fts_after_insert AFTER INSERT ON bug BEGIN
+        INSERT INTO bug_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS bug_fts_after_delete AFTER DELETE ON bug BEGIN
+        INSERT INTO bug_fts(bug_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS bug_fts_after_update AFTER UPDATE OF title, description ON bug BEGIN
+        INSERT INTO bug_fts(bug_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO bug_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END""",
+]
+
+# The change log (website.changes) is appended to in the transaction of the write itself, so the views, the
+# batch endpoints, the account purge and the archive job all show up in the log without calling anything.
+V1_CHANGE_LOG_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS bug_change_after_insert AFTER INSERT ON bug BEGIN
+        INSERT INTO bug_change(op, bug_id, user_id, title, status, priority)
+        VALUES ('create', new.id, new.user_id, new.title, new.status, new.priority);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS bug_change_after_update AFTER UPDATE ON bug BEGIN
+        INSERT INTO bug_change(op, bug_id, user_id, title, status, priority)
+        VALUES ('update', new.id, new.user_id, new.title, new.status, new.priority);
+    END""",
+    # a bug moved to the archive is logged once as 'archive' by the trigger below, not as 'delete'
+    """CREATE TRIGGER IF NOT EXISTS bug_change_after_bug_delete AFTER DELETE ON bug
+    WHEN NOT EXISTS (SELECT 1 FROM bug_archive WHERE id = old.id) BEGIN
+        INSERT INTO bug_change(op, bug_id, user_id, title, status, priority)
+        VALUES ('delete', old.id, old.user_id, old.title, old.status, old.priority);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS bug_change_after_archive AFTER INSERT ON bug_archive BEGIN
+        INSERT INTO bug_change(op, bug_id, user_id, title, status, priority)
+        VALUES ('archive', new.id, new.user_id, new.title, new.status, new.priority);
+    END""",
+]
+
+# bug_stats (website.stats) follows every write to the bug table. Archiving a bug moves it from bug to
+# bug_archive without changing the counts, they only drop when an archived bug is deleted too.
+V1_STATS_TRIGGERS = {
+    'bug_stats_after_insert': """CREATE TRIGGER IF NOT EXISTS bug_stats_after_insert AFTER INSERT ON bug BEGIN
+        INSERT INTO bug_stats(user_id, status, priority, count) VALUES (new.user_id, new.status, new.priority, 1)
+        ON CONFLICT(user_id, status, priority) DO UPDATE SET count = count + 1;
+    END""",
+    'bug_stats_after_update': """CREATE TRIGGER IF NOT EXISTS bug_stats_after_update
+    AFTER UPDATE OF user_id, status, priority ON bug
+    WHEN old.user_id IS NOT new.user_id OR old.status IS NOT new.status OR old.priority IS NOT new.priority BEGIN
+        UPDATE bug_stats SET count = count - 1
+        WHERE user_id = old.user_id AND status = old.status AND priority = old.priority;
+        DELETE FROM bug_stats
+        WHERE user_id = old.user_id AND status = old.status AND priority = old.priority AND count <= 0;
+        INSERT INTO bug_stats(user_id, status, priority, count) VALUES (new.user_id, new.status, new.priority, 1)
+        ON CONFLICT(user_id, status, priority) DO UPDATE SET count = count + 1;
+    END""",
+    'bug_stats_after_delete': """CREATE TRIGGER IF NOT EXISTS bug_stats_after_delete AFTER DELETE ON bug
+    WHEN NOT EXISTS (SELECT 1 FROM bug_archive WHERE id = old.id) BEGIN
+        UPDATE bug_stats SET count = count - 1
+        WHERE user_id = old.user_id AND status = old.status AND priority = old.priority;
+        DELETE FROM bug_stats
+        WHERE user_id = old.user_id AND status = old.status AND priority = old.priority AND count <= 0;
+    END""",
+    'bug_stats_after_archive_delete': """CREATE TRIGGER IF NOT EXISTS bug_stats_after_archive_delete
+    AFTER DELETE ON bug_archive BEGIN
+        UPDATE bug_stats SET count = count - 1
+        WHERE user_id = old.user_id AND status = old.status AND priority = old.priority;
+        DELETE FROM bug_stats
+        WHERE user_id = old.user_id AND status = old.status AND priority = old.priority AND count <= 0;
+    END""",
+}
+V1_REBUILD_STATS = [
+    'DELETE FROM bug_stats',
+    """INSERT INTO bug_stats(user_id, status, priority, count)
+    SELECT user_id, status, priority, count(*) FROM (
+        SELECT user_id, status, priority FROM bug
+        UNION ALL
+        SELECT user_id, status, priority FROM bug_archive
+    ) GROUP BY user_id, status, priority""",
+]
+
+
+def create_schema(engine):
+    """
+    Version 1: the tables, indexes and triggers, from the frozen V1_ statements above.
+
+    Works on an empty database as well as on one created before the schema was versioned: every step
+    skips what already exists and adds the columns and indexes introduced since.
+    The full-text index and bug_stats are filled from the existing bugs when they are created.
+    """
+    with engine.begin() as connection:
+        for statement in V1_TABLES:
+            connection.exec_driver_sql(statement)
+        for table, columns in V1_ADDED_COLUMNS.items():
+            existing = {row[1] for row in connection.exec_driver_sql(f'PRAGMA table_info({table})')}
+            for name, definition in columns.items():
+                if name not in existing:
+                    connection.exec_driver_sql(f'ALTER TABLE {table} ADD COLUMN {name} {definition}')
+        for statement in V1_INDEXES:
+            connection.exec_driver_sql(statement)
+        for statement in V1_CHANGE_LOG_TRIGGERS:
+            connection.exec_driver_sql(statement)
+
+        existing = set(connection.execute(
+            text("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'bug_stats_%'")
+        ).scalars())
+        for statement in V1_STATS_TRIGGERS.values():
+            connection.exec_driver_sql(statement)
+        if existing != set(V1_STATS_TRIGGERS):
+            for statement in V1_REBUILD_STATS:
+                connection.exec_driver_sql(statement)
+
+    with engine.begin() as connection:
+        exists = search.search_index_exists(connection)
+        try:
+            connection.exec_driver_sql(V1_FTS_TABLE)
+        except Exception:  # sqlite3 built without the fts5 module, search falls back to ILIKE
+            return
+        for statement in V1_FTS_TRIGGERS:
+            connection.exec_driver_sql(statement)
+        if not exists:
+            connection.exec_driver_sql("INSERT INTO bug_fts(bug_fts) VALUES ('rebuild')")
+
+
+# Version 2: bug ids are never reused. Without AUTOINCREMENT sqlite hands out max(id) + 1, so once the newest
+# bugs are archived their ids come back, while the triggers take an id present in bug_archive for an archived
+# bug and the archive job inserts into bug_archive by id.
+V2_BUG_TABLE = """CREATE TABLE bug_v2 (
+        id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+        title VARCHAR(100) NOT NULL,
+        description TEXT NOT NULL,
+        status VARCHAR(20) NOT NULL,
+        priority VARCHAR(20) NOT NULL,
+        date_created DATETIME NOT NULL,
+        user_id INTEGER NOT NULL,
+        version INTEGER DEFAULT '1' NOT NULL,
+        FOREIGN KEY(user_id) REFERENCES user (id) ON DELETE CASCADE
+    )"""
+V2_BUG_COLUMNS = 'id, title, description, status, priority, date_created, user_id, version'
+# start after every id handed out so far, archived ones included
+V2_SEED_SEQUENCE = [
+    "DELETE FROM sqlite_sequence WHERE name = 'bug'",
+    """INSERT INTO sqlite_sequence(name, seq) SELECT 'bug', max(
+        coalesce((SELECT max(id) FROM bug), 0), coalesce((SELECT max(id) FROM bug_archive), 0)
+    )""",
+]
+
+
+def autoincrement_bug_ids(engine):
+    """
+    Version 2: rebuilds the bug table with AUTOINCREMENT and starts its ids after the archived ones.
+
+    sqlite cannot add AUTOINCREMENT to a table, so the rows are copied into a new table that replaces it.
+    Dropping the old table drops its indexes and triggers, they are created again on the new one (the
+    version 1 statements, unchanged). No trigger fires during the copy, and the full-text index keeps
+    matching the rows since the ids are kept. Reads and writes the whole bug table once.
+    """
+    with engine.connect() as connection:
+        # DDL would otherwise commit statement by statement, and IMMEDIATE makes a second process starting
+        # the same migration wait for this one, then see the new table and skip it
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
+        sql = connection.exec_driver_sql("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'bug'").scalar()
+        if 'AUTOINCREMENT' not in sql.upper():
+            connection.exec_driver_sql(V2_BUG_TABLE)
+            connection.exec_driver_sql(f'INSERT INTO bug_v2({V2_BUG_COLUMNS}) SELECT {V2_BUG_COLUMNS} FROM bug')
+            connection.exec_driver_sql('DROP TABLE bug')
+            connection.exec_driver_sql('ALTER TABLE bug_v2 RENAME TO bug')
+            for statement in V1_BUG_INDEXES + V1_CHANGE_LOG_TRIGGERS + list(V1_STATS_TRIGGERS.values()):
+                connection.exec_driver_sql(statement)
+            if search.search_index_exists(connection):
+                for statement in V1_FTS_TRIGGERS:
+                    connection.exec_driver_sql(statement)
+            for statement in V2_SEED_SEQUENCE:
+                connection.exec_driver_sql(statement)
+        connection.commit()
+
+
+# Version 3: the dashboard's priority and status orders page through an index each instead of sorting every
+# bug of the user for every page. The expressions must stay identical to models.PRIORITY_RANK and STATUS_RANK.
+V3_INDEXES = [
+    """CREATE INDEX IF NOT EXISTS ix_bug_user_id_priority_rank ON bug (
+        user_id,
+        CASE priority WHEN 'Low' THEN 1 WHEN 'Medium' THEN 2 WHEN 'High' THEN 3 ELSE 4 END,
+        date_created
+    )""",
+    """CREATE INDEX IF NOT EXISTS ix_bug_user_id_status_rank ON bug (
+        user_id,
+        CASE status WHEN 'Open' THEN 3 WHEN 'In Progress' THEN 2 WHEN 'Resolved' THEN 1 ELSE 0 END,
+        date_created
+    )""",
+]
+
+
+def create_rank_indexes(engine):
+    """Version 3: the indexes of the dashboard's priority and status orders. Reads the whole bug table once."""
+    with engine.begin() as connection:
+        for statement in V3_INDEXES:
+            connection.exec_driver_sql(statement)
+
+
+# MIGRATIONS[n - 1] brings a database from version n - 1 to version n. Append a function when a model or a
+# trigger changes, never edit the ones already released. A migration writes out its own DDL like version 1:
+# the models describe the latest version only, and the databases it starts from are the older ones.
+MIGRATIONS = [
+    create_schema,
+    autoincrement_bug_ids,
+    create_rank_indexes,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(engine):
+    """The version of the schema of a database, stored as PRAGMA user_version. 0 for a new or unversioned one."""
+    with engine.connect() as connection:
+        return connection.exec_driver_sql('PRAGMA user_version').scalar()
+
+
+def migrate(engine):
+    """
+    Brings the schema of a database up to SCHEMA_VERSION.
+
+    Returns:
+        list: The versions applied, empty when the database was already current. That check is a single
+        PRAGMA read, so starting a process against an up-to-date database does no schema work at all.
+
+    Raises:
+        RuntimeError: When the database was migrated by a newer release of the app.
+
+    Notes:
+        - The version is written after each migration, so a migration that fails is run again on the next start.
+        - Migrations must be safe to run twice: two processes starting at once on an old database (without
+          gunicorn's preload_app) can both run them.
+    """
+    version = schema_version(engine)
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(f'The database schema is at version {version}, this release only knows up to '
+                           f'{SCHEMA_VERSION}')
+
+    applied = []
+    for number in range(version + 1, SCHEMA_VERSION + 1):
+        MIGRATIONS[number - 1](engine)
+        with engine.begin() as connection:
+            connection.exec_driver_sql(f'PRAGMA user_version = {number}')
+        applied.append(number)
+    return applied
+
+
+def init_app(app):
+    """
+    Migrates the database of an app and records whether /search can use the full-text index.
+
+    Config:
+        FULL_TEXT_SEARCH (bool): Set here, False when sqlite has no FTS5 (search then falls back to ILIKE).
+    """
+    with app.app_context():
+        applied = migrate(db.engine)
+        if applied:
+            app.logger.info('Database schema migrated to version %s', applied[-1])
+        with db.engine.connect() as connection:
+            app.config['FULL_TEXT_SEARCH'] = search.search_index_exists(connection)
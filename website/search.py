@@ -0,0 +1,52 @@
+import re
+from sqlalchemy import text, func, literal_column, table, column
+
+
+# External content FTS5 index over bug.title and bug.description, created and kept in sync with the bug table
+# by triggers (see website.schema). The index only stores the tokens, the text itself is read back from the
+# bug table through content_rowid.
+FTS_TABLE = 'bug_fts'
+
+bug_fts = table(FTS_TABLE, column('rowid'))
+
+_token_pattern = re.compile(r'\w+', re.UNICODE)
+
+
+def search_index_exists(connection):
+    """Whether the full-text index has been created in the database of a connection."""
+    return connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': FTS_TABLE}
+    ).first() is not None
+
+
+def match_expression(keyword, column_name=None):
+    """
+    Turn a search box keyword into an FTS5 MATCH expression.
+
+    Every word of the keyword becomes a quoted prefix term, so 'ui ali' matches 'UI Alignment Issue'
+    and the user's input can never be interpreted as FTS5 query syntax.
+
+    Args:
+        keyword (str): The text typed by the user.
+        column_name (str): Restrict the match to this column of the index (e.g. 'title').
+
+    Returns:
+        str: The MATCH expression, or None if the keyword contains no searchable words.
+    """
+    tokens = _token_pattern.findall(keyword or '')
+    if not tokens:
+        return None
+    expression = ' '.join(f'"{token}"*' for token in tokens)
+    if column_name:
+        expression = f'{column_name} : ({expression})'
+    return expression
+
+
+def matches(expression):
+    """Filter clause selecting the bug_fts rows that match an expression built by match_expression."""
+    return literal_column(FTS_TABLE).op('MATCH')(expression)
+
+
+def rank():
+    """bm25 relevance of the current bug_fts row. Lower values are better matches."""
+    return func.bm25(literal_column(FTS_TABLE))
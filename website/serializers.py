@@ -0,0 +1,119 @@
+import json
+from flask import current_app
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import select, func
+from . import profiling
+from .models import Bug
+
+try:
+    import orjson  # optional, several times faster than the json module
+except ImportError:
+    orjson = None
+
+
+# Attributes of a serialized bug, in output order
+BUG_FIELDS = ('id', 'title', 'description', 'status', 'priority', 'date_created')
+SUMMARY_LENGTH = 120  # characters of the description shown in the bug list
+
+
+def bug_column(field, model=Bug):
+    """
+    The column to select for a bug attribute, of Bug or of BugArchive.
+
+    date_created is stored by SQLAlchemy as 'YYYY-MM-DD HH:MM:SS.ffffff', so its first 19 characters are
+    already the 'YYYY-MM-DD HH:MM:SS' the API returns. Cutting them in SQL means no datetime object is
+    built and no strftime is called for any row.
+    """
+    if field == 'date_created':
+        return func.substr(model.date_created, 1, 19).label('date_created')
+    return getattr(model, field)
+
+
+def select_bugs(fields=BUG_FIELDS, model=Bug):
+    """A Core SELECT of the given bug attributes, rows come back as plain tuples ready for rows_to_dicts."""
+    return select(*[bug_column(field, model) for field in fields])
+
+
+def select_bug_summaries():
+    """
+    A Core SELECT of the bug list columns, with 'summary' in place of the full description.
+
+    The summary is the first SUMMARY_LENGTH + 1 characters of the description: one more than is shown,
+    so the template can tell whether it was cut and add an ellipsis.
+    """
+    return select(
+        Bug.id, Bug.title, func.substr(Bug.description, 1, SUMMARY_LENGTH + 1).label('summary'),
+        Bug.status, Bug.priority, bug_column('date_created'),
+    )
+
+
+def rows_to_dicts(rows, fields=BUG_FIELDS):
+    """Turns rows of select_bugs(fields) into the dictionaries returned by the API."""
+    profiling.add_rows(len(rows))
+    return [dict(zip(fields, row)) for row in rows]
+
+
+def dumps(obj):
+    """Encodes plain data (dicts, lists, strings, numbers) as a JSON string."""
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj, separators=(',', ':'))
+
+
+def json_response(obj, status=200):
+    """A JSON response encoded with dumps(), for the endpoints returning lists of bugs."""
+    with profiling.timing_serialization():
+        body = dumps(obj)
+    return current_app.response_class(body, status=status, mimetype='application/json')
+
+
+def iter_json_array(partitions, fields=BUG_FIELDS):
+    """
+    Yields a JSON array of bugs piece by piece.
+
+    Args:
+        partitions: Lists of rows of select_bugs(fields), e.g. Result.partitions(). Each list is encoded
+            with one dumps() call, which is much cheaper than encoding the rows one at a time.
+    """
+    yield '['
+    separator = ''
+    for rows in partitions:
+        if rows:
+            with profiling.timing_serialization():
+                chunk = separator + dumps(rows_to_dicts(rows, fields))[1:-1]
+            yield chunk
+            separator = ','
+    yield ']'
+
+
+def iter_ndjson(partitions, fields=BUG_FIELDS):
+    """Yields bugs as newline delimited JSON, one line per bug. See iter_json_array for partitions."""
+    for rows in partitions:
+        with profiling.timing_serialization():
+            lines = [dumps(bug_dict) + '\n' for bug_dict in rows_to_dicts(rows, fields)]
+        yield from lines
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider that encodes with orjson when it is installed.
+
+    Installed as app.json, so jsonify() everywhere goes through it. Values orjson does not handle the way
+    Flask does (dates, decimals, dataclasses...) still go through DefaultJSONProvider.default, so responses
+    look the same with or without orjson.
+    """
+
+    def dumps(self, obj, **kwargs):
+        with profiling.timing_serialization():
+            return self._dumps(obj, **kwargs)
+
+    def _dumps(self, obj, **kwargs):
+        if orjson is None or set(kwargs) - {'separators'}:  # indent (debug mode) or other stdlib options
+            return super().dumps(obj, **kwargs)
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(obj, default=self.default, option=option).decode()
+        except TypeError:  # e.g. integers beyond 64 bits
+            return super().dumps(obj)
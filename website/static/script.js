@@ -1,4 +1,4 @@
-document.getElementById("bugForm").addEventListener("submit", function (event) {
+document.getElementById("bugForm")?.addEventListener("submit", function (event) {
   event.preventDefault();
 
   const form = event.target;
@@ -91,16 +91,23 @@ function deleteBug(bugId) {
   }
 }
 
-document.getElementById("searchForm").addEventListener("submit", function (event) {
+document.getElementById("searchForm")?.addEventListener("submit", function (event) {
   event.preventDefault();
 
   const form = event.target;
   const formData = new FormData(form);
   const keyword = formData.get("keyword");
   const category = formData.get("category");
+  const params = new URLSearchParams({ keyword: keyword, category: category });
+  // Optional date range, the backend filters on it for every category
+  ["from", "to"].forEach((name) => {
+      if (formData.get(name)) {
+          params.append(name, formData.get(name));
+      }
+  });
 
   // Send a GET request to the backend API to search for bugs
-  fetch(`/search?keyword=${keyword}&category=${category}`)
+  fetch(`/search?${params}`)
       .then((response) => response.json())
       .then((data) => {
           console.log(data); // For debugging purposes
@@ -128,7 +135,11 @@ function updateBugList(bugs) {
       bugRow.appendChild(titleCell);
 
       const descriptionCell = document.createElement("td");
-      descriptionCell.textContent = bug.description;
+      descriptionCell.textContent = truncateDescription(bug.description) + " ";
+      const detailsLink = document.createElement("a");
+      detailsLink.href = `/bugs/${bug.id}/details`;
+      detailsLink.textContent = "Details";
+      descriptionCell.appendChild(detailsLink);
       bugRow.appendChild(descriptionCell);
 
       const statusCell = document.createElement("td");
@@ -163,7 +174,83 @@ function updateBugList(bugs) {
 }
 
 
+// Same length as serializers.SUMMARY_LENGTH, the full description is on the details page
+const SUMMARY_LENGTH = 120;
+
+function truncateDescription(description) {
+  return description.length > SUMMARY_LENGTH ? description.slice(0, SUMMARY_LENGTH) + "…" : description;
+}
+
+function loadNextPage(placeholderRow) {
+  // Replace the "Load more" row with the next page of rows rendered by /bugs/rows
+  if (placeholderRow.dataset.loading) {
+      return;
+  }
+  placeholderRow.dataset.loading = "true";
+  fetch(placeholderRow.dataset.url)
+      .then((response) => response.text())
+      .then((html) => {
+          placeholderRow.insertAdjacentHTML("afterend", html);
+          placeholderRow.remove();
+          observeNextPage();
+      })
+      .catch((error) => {
+          console.error("Error loading bugs:", error);
+          delete placeholderRow.dataset.loading;
+      });
+}
+
+const nextPageObserver = "IntersectionObserver" in window ? new IntersectionObserver((entries) => {
+  entries.forEach((entry) => {
+      if (entry.isIntersecting) {
+          nextPageObserver.unobserve(entry.target);
+          loadNextPage(entry.target);
+      }
+  });
+}) : null;
+
+function observeNextPage() {
+  // Load the next page as soon as its placeholder row scrolls into view
+  const placeholderRow = document.querySelector("#bugTable tr.next-page");
+  if (placeholderRow && nextPageObserver) {
+      nextPageObserver.observe(placeholderRow);
+  }
+}
+
+function loadBugDetails() {
+  // Fetch the full bug, including the description that the list only shows the start of
+  const container = document.getElementById("bugDetails");
+  if (!container) {
+      return;
+  }
+  fetch(container.dataset.url)
+      .then((response) => response.json())
+      .then((bug) => {
+          if (bug.error) {
+              container.textContent = bug.error;
+              return;
+          }
+          const list = document.createElement("dl");
+          [["Title", bug.title], ["Description", bug.description], ["Status", bug.status],
+           ["Priority", bug.priority], ["Date Created", bug.date_created]].forEach(([label, value]) => {
+              const term = document.createElement("dt");
+              term.textContent = label;
+              const definition = document.createElement("dd");
+              definition.textContent = value;
+              definition.style.whiteSpace = "pre-wrap";
+              list.append(term, definition);
+          });
+          container.appendChild(list);
+      })
+      .catch((error) => {
+          console.error("Error loading bug details:", error);
+      });
+}
+
 document.addEventListener("DOMContentLoaded", function () {
+    observeNextPage();
+    loadBugDetails();
+
     // Handle the "Delete" button click
     document.getElementById("deleteAccountButton").addEventListener("click", function () {
         // Display the confirmation modal
@@ -0,0 +1,56 @@
+import click
+from sqlalchemy import select, func, text
+from . import db, storage
+from .models import BugStats
+
+
+# bug_stats is kept in step with every write to the bug table by triggers (see website.schema), whichever
+# code path issues it. Archiving a bug does not change the counts, they only drop when an archived bug is
+# deleted too. The statements below recompute it from scratch.
+REBUILD_STATS = [
+    'DELETE FROM bug_stats',
+    """INSERT INTO bug_stats(user_id, status, priority, count)
+    SELECT user_id, status, priority, count(*) FROM (
+        SELECT user_id, status, priority FROM bug
+        UNION ALL
+        SELECT user_id, status, priority FROM bug_archive
+    ) GROUP BY user_id, status, priority""",
+]
+
+
+def rebuild_stats():
+    """Recomputes bug_stats from the bug and bug_archive tables in one transaction. Reads every bug."""
+    for statement in REBUILD_STATS:
+        db.session.execute(text(statement))
+    db.session.commit()
+
+
+def select_user_stats(user_id):
+    """A Core SELECT of the (status, priority, count) rows of a user, read from the bug_stats primary key."""
+    return select(BugStats.status, BugStats.priority, BugStats.count).where(BugStats.user_id == user_id)
+
+
+def user_stats(user_id):
+    """
+    The bug counts of a user as returned by /stats.
+
+    Returns:
+        dict: 'total', the counts by 'status' and by 'priority', and 'breakdown' with one
+        {'status', 'priority', 'count'} entry per combination in use.
+    """
+    stats = {'total': 0, 'status': {}, 'priority': {}, 'breakdown': []}
+    for status, priority, count in storage.read(select_user_stats(user_id)):
+        stats['total'] += count
+        stats['status'][status] = stats['status'].get(status, 0) + count
+        stats['priority'][priority] = stats['priority'].get(priority, 0) + count
+        stats['breakdown'].append({'status': status, 'priority': priority, 'count': count})
+    return stats
+
+
+def init_app(app):
+    @app.cli.command('rebuild-stats')
+    def rebuild_stats_command():
+        """Recompute the bug_stats table from the bugs, e.g. after editing the database by hand."""
+        rebuild_stats()
+        rows = db.session.scalar(select(func.count()).select_from(BugStats))
+        click.echo(f'bug_stats rebuilt, {rows} rows.')
@@ -0,0 +1,103 @@
+from sqlalchemy import event
+from . import db
+
+
+# PRAGMAs applied to every new sqlite connection, by STORAGE_PROFILE. 'default' keeps sqlite's own settings
+# (rollback journal, synchronous=FULL); 'wal' lets readers run alongside a writer and makes commits cheaper.
+STORAGE_PROFILES = {
+    'default': {
+        'foreign_keys': 'ON',
+    },
+    'wal': {
+        'foreign_keys': 'ON',
+        'journal_mode': 'WAL',  # readers no longer block writers and vice versa
+        'synchronous': 'NORMAL',  # with WAL, fsync on checkpoint instead of on every commit
+        'busy_timeout': 5000,  # ms to wait for the write lock before failing with "database is locked"
+        'mmap_size': 256 * 1024 * 1024,  # read pages through the OS page cache instead of copying them
+        'temp_store': 'MEMORY',  # temp b-trees for ORDER BY / GROUP BY stay off disk
+        # no cache_size: the page cache is per connection, and up to pool_size + max_overflow connections of
+        # two engines (main and read-only) are open per process, so sqlite's ~2 MiB default is kept. mmap_size
+        # already serves reads from the OS page cache, which all connections and processes share.
+    },
+}
+
+DEFAULT_ENGINE_OPTIONS = {
+    'pool_size': 10,
+    'max_overflow': 20,
+    'pool_timeout': 30,
+}
+
+# Bind of the read-only engine used by the GET endpoints, see read()
+READONLY_BIND = 'readonly'
+
+
+def configure(app):
+    """
+    Fills in the storage settings of an app. Must run before db.init_app(app), which creates the engines.
+
+    Config:
+        STORAGE_PROFILE (str): Key of STORAGE_PROFILES, 'wal' by default.
+        SQLITE_PRAGMAS (dict): PRAGMAs applied on top of the profile. A value of None drops a PRAGMA of the profile.
+            E.g. {'cache_size': -16 * 1024} for a 16 MiB page cache per connection (negative values are KiB),
+            counting up to 2 * (pool_size + max_overflow) connections per process.
+        SQLALCHEMY_ENGINE_OPTIONS (dict): Pool options, DEFAULT_ENGINE_OPTIONS fill in the missing ones.
+        STORAGE_READONLY_BIND (bool): Open a second engine with query_only connections for the GET
+            endpoints. On by default for sqlite database files.
+    """
+    app.config.setdefault('STORAGE_PROFILE', 'wal')
+    pragmas = dict(STORAGE_PROFILES[app.config['STORAGE_PROFILE']])
+    pragmas.update(app.config.get('SQLITE_PRAGMAS') or {})
+    app.config['SQLITE_PRAGMAS'] = {name: value for name, value in pragmas.items() if value is not None}
+
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    is_sqlite_file = uri.startswith('sqlite') and uri.rstrip('/') not in ('sqlite:', 'sqlite:///:memory:')
+    if is_sqlite_file:
+        # in-memory databases use a single static connection, pool options do not apply to them
+        options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+        for name, value in DEFAULT_ENGINE_OPTIONS.items():
+            options.setdefault(name, value)
+
+    app.config.setdefault('STORAGE_READONLY_BIND', is_sqlite_file)
+    if app.config['STORAGE_READONLY_BIND']:
+        app.config.setdefault('SQLALCHEMY_BINDS', {})[READONLY_BIND] = uri
+
+
+def init_app(app):
+    """Registers the PRAGMA listeners on the engines created by db.init_app(app)."""
+    with app.app_context():
+        for bind_key, engine in db.engines.items():
+            if engine.dialect.name != 'sqlite':
+                continue
+            pragmas = dict(app.config['SQLITE_PRAGMAS'])
+            if bind_key == READONLY_BIND:
+                pragmas['query_only'] = 'ON'  # any write through this engine fails instead of taking the lock
+            install_pragmas(engine, pragmas)
+
+
+def install_pragmas(engine, pragmas):
+    """Runs PRAGMA name=value for each of the pragmas on every new connection of an engine."""
+    event.listen(engine, 'connect', _pragma_listener(pragmas))
+
+
+def _pragma_listener(pragmas):
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+    return apply_pragmas
+
+
+def read_engine():
+    """The engine GET endpoints read from: the read-only bind when it is configured, else the main engine."""
+    return db.engines.get(READONLY_BIND) or db.engine
+
+
+def read(statement, **kwargs):
+    """
+    Executes a SELECT on the read-only engine through the current session.
+
+    Returns:
+        Result: Like db.session.execute(statement), ORM selects return model instances.
+    """
+    return db.session.execute(statement, bind_arguments={'bind': read_engine()}, **kwargs)
@@ -0,0 +1,90 @@
+import threading
+from flask import current_app
+from sqlalchemy.orm import make_transient_to_detached
+from . import db
+from .cache import MemoryCache
+from .models import User
+
+
+# Columns kept in the cache. The password hash is left out: it is loaded from the database when
+# current_user.password is read, so a cached record never holds or serves a stale hash.
+CACHED_COLUMNS = ('id', 'email', 'username')
+
+
+class UserCache:
+    """
+    Cache of the user records behind flask_login's current_user.
+
+    Flask-Login calls the user loader on every request that has a logged in user. With this cache
+    the loader answers from memory instead of running SELECT ... FROM user WHERE id = ?.
+
+    Args:
+        backend: Object with get(key), set(key, value, ttl=None) and delete(key), e.g. a MemoryCache.
+
+    Notes:
+        - The records are attached to the request's session without a query, so current_user can be
+          modified and committed like before.
+        - The views that change a user call invalidate(); other processes keep their copy until it expires
+          (USER_CACHE_TTL seconds).
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    def load(self, user_id):
+        """Returns the User with this id attached to the current session, or None if it does not exist."""
+        record = self.backend.get(_key(user_id))
+        if record is None:
+            with self._lock:
+                self.misses += 1
+            user = db.session.get(User, user_id)
+            if user is not None:
+                self.backend.set(_key(user_id), {column: getattr(user, column) for column in CACHED_COLUMNS})
+            return user
+
+        with self._lock:
+            self.hits += 1
+        user = User(**record)
+        make_transient_to_detached(user)  # looks like a row loaded from the database, with password expired
+        return db.session.merge(user, load=False)
+
+    def invalidate(self, user_id):
+        self.backend.delete(_key(user_id))
+        with self._lock:
+            self.invalidations += 1
+
+    def stats(self):
+        """Hit, miss and invalidation counters since the app started."""
+        return {'hits': self.hits, 'misses': self.misses, 'invalidations': self.invalidations}
+
+
+def _key(user_id):
+    return f'user:{user_id}'
+
+
+def invalidate(user_id):
+    """Drops a user from the cache of the current app, call it after changing or deleting the user."""
+    current_app.extensions['user_cache'].invalidate(user_id)
+
+
+def init_app(app):
+    """
+    Creates the user cache of an app.
+
+    Config:
+        USER_CACHE_BACKEND: Shared cache client to use, a process-local MemoryCache by default.
+        USER_CACHE_TTL (float): Seconds a user record stays cached, 30 by default.
+        USER_CACHE_SIZE (int): Maximum number of users in the MemoryCache, 10000 by default.
+
+    Returns:
+        UserCache: The cache, also available as app.extensions['user_cache'].
+    """
+    backend = app.config.get('USER_CACHE_BACKEND') or MemoryCache(
+        max_entries=app.config.get('USER_CACHE_SIZE', 10000), ttl=app.config.get('USER_CACHE_TTL', 30)
+    )
+    app.extensions['user_cache'] = UserCache(backend)
+    return app.extensions['user_cache']
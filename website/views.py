@@ -1,48 +1,136 @@
-from flask import Blueprint, render_template, request, flash, jsonify
+from flask import Blueprint, render_template, stream_template, request, flash, get_flashed_messages, jsonify, \
+    Response, stream_with_context, current_app, abort
 from flask_login import login_required, current_user 
 from . import db
 import json
-from .models import Bug, User
-from datetime import datetime
+import time
+from .models import Bug, BugArchive, User, BUG_STATUSES, BUG_PRIORITIES, PRIORITY_RANK, STATUS_RANK
+from datetime import datetime, timedelta
+from sqlalchemy import select, insert, update, delete, union_all, or_, func, tuple_
+from . import search, batch, storage, httpcache, serializers, changes, profiling, stats
 
 
 views = Blueprint('views', __name__)
 
+# Attributes of a single bug: the exported ones, and the version to send back with PATCH /bugs/<id>
+BUG_DETAIL_FIELDS = serializers.BUG_FIELDS + ('version',)
+
+
+# Sort orders of the dashboard as (rank, descending): by the rank if there is one, then by date_created and id,
+# all in the same direction. Priorities and statuses sort in the order of the bug form, not alphabetically.
+INDEX_SORTS = {
+    'newest': (None, True),
+    'oldest': (None, False),
+    'priority': (PRIORITY_RANK, True),
+    'status': (STATUS_RANK, True),
+}
+
 
 @views.route('/')
 @login_required
 def index():
-    """Fetch bug data from the database and pass it to the template"""
-    bugs = Bug.query.filter_by(user=current_user).all()
-    return render_template('index.html', bugs=bugs, user=current_user)
+    """
+    Render the dashboard with the first page of the user's bugs.
+
+    Query Parameters:
+        sort (str): One of INDEX_SORTS, 'newest' by default.
+        after (str): Start after this bug, the cursor of a 'next page' row. The first bugs by default.
+
+    Notes:
+        - Only INDEX_PAGE_SIZE bugs (50 by default) are rendered. script.js loads the next pages from
+          /bugs/rows when the end of the table scrolls into view. Every page is read from where the previous
+          one ended in an index, so the pages of a long-lived account cost the same however deep they are.
+        - The page is streamed with stream_template, so the browser starts rendering the header and the
+          forms while the rows are still being generated.
+        - Descriptions are cut to serializers.SUMMARY_LENGTH characters, the full bug is on the details page.
+        - The flashed messages are taken out of the session before streaming: the session cookie is written
+          with the response headers, so popping them from the template would leave them in the session,
+          shown again on the next page and disabling the response cache until then.
+    """
+    after, sort = _dashboard_args()
+    return stream_template('index.html', user=current_user, sorts=INDEX_SORTS,
+                           flashes=get_flashed_messages(with_categories=True), **_dashboard_page(after, sort))
+
 
+@views.route('/bugs/rows')
+@login_required
+@httpcache.cached_response('bugs')
+def bug_rows():
+    """Render one page of the dashboard's bug list as table rows, for script.js to append (see index)."""
+    after, sort = _dashboard_args()
+    return render_template('_bug_rows.html', **_dashboard_page(after, sort))
+
+
+@views.route('/bugs/<int:bug_id>', methods=['GET'])
+@login_required
+@httpcache.cached_response('bugs')
+def get_bug(bug_id):
+    """
+    Retrieves one bug report, with its full description, in JSON format.
+
+    Returns:
+        JSON: The bug with the attributes listed in get_bugs and its 'version', or a 404 error if it does not exist.
+    """
+    row = storage.read(serializers.select_bugs(BUG_DETAIL_FIELDS).where(Bug.id == bug_id)).first()
+    if row is None:
+        return jsonify({'error': 'Bug not found'}), 404
+    return serializers.json_response(serializers.rows_to_dicts([row], BUG_DETAIL_FIELDS)[0])
+
+
+@views.route('/bugs/<int:bug_id>/details')
+@login_required
+def bug_details(bug_id):
+    """Render the details page of a bug, which fetches the bug from get_bug."""
+    return render_template('bug_details.html', bug_id=bug_id, user=current_user)
+
+
+EXPORT_BATCH_SIZE = 1000  # rows pulled from the cursor at a time while streaming
+CHANGES_PAGE_SIZE = 100  # changes returned by /bugs/changes when no limit is given
+STREAM_RETRY_AFTER = 10  # seconds, sent with the 503 of /bugs/changes/stream when every stream slot is taken
+EXPORT_MIMETYPES = {'json': 'application/json', 'ndjson': 'application/x-ndjson'}
 
 
 @views.route('/json', methods=['GET'])
 @login_required
+@httpcache.cached_response('bugs')
 def get_bugs():
     """
     Retrieves a list of bug reports in JSON format.
 
+    Query Parameters:
+        after (int): Only return bugs with an id greater than this value (keyset cursor). Defaults to 0.
+        limit (int): Maximum number of bugs to return. Defaults to all remaining bugs.
+        fields (str): Comma separated list of attributes to include, e.g. 'id,title,status'.
+            Defaults to every attribute. 'id' is always included so the client can continue paging.
+        format (str): 'json' (default) streams a JSON array, 'ndjson' streams one JSON object per line.
+        include_archived (str): '1' to also return the bugs moved to the archive by `flask archive-bugs`,
+            merged into the same id order.
+
     Returns:
-        JSON: A JSON representation of bug reports with their attributes.
+        JSON: A JSON representation of bug reports with their attributes, or a 400 error for invalid parameters.
 
     Notes:
-        - This function queries the database for all bug reports.
-        - It constructs a list of dictionaries, where each dictionary represents a bug report.
-        - The dictionaries contain the following bug attributes:
+        - Bugs are always returned ordered by 'id', so the 'id' of the last bug received can be
+          passed back as '?after=' to fetch the next page. No offset is involved, so every page
+          costs the same no matter how deep into the table it is.
+        - Only the requested columns are selected; the 'description' column is not read unless asked for.
+          The rows are read with a Core select and encoded by website.serializers (orjson when installed).
+        - The response is streamed from a database cursor in batches of EXPORT_BATCH_SIZE rows, so
+          memory use and time to first byte do not depend on the number of bugs in the table.
+        - Pages of at most EXPORT_BATCH_SIZE bugs are built in memory instead, so they can be served from the
+          response cache and answered with 304 Not Modified while no bug changes.
+        - The dictionaries can contain the following bug attributes:
           - 'id': The unique identifier of the bug.
           - 'title': The title or summary of the bug.
           - 'description': A detailed description of the bug.
           - 'status': The current status of the bug.
           - 'priority': The priority level assigned to the bug.
           - 'date_created': The date and time when the bug report was created, formatted as 'YYYY-MM-DD HH:MM:SS'.
-        - The list of bug dictionaries is then converted to JSON format using Flask's 'jsonify' function.
         - This endpoint is typically used to retrieve a list of bug reports in a machine-readable format, e.g., for
           consumption by a front-end application or for exporting bug data.
 
     Example:
-        An example of the JSON response for two bug reports might look like this:
+        GET /json?after=0&limit=2 might return:
         [
             {
                 'id': 1,
@@ -61,20 +149,27 @@ def get_bugs():
                 'date_created': '2023-09-08 10:15:00'
             }
         ]
+
+        GET /json?after=2&fields=title,status&format=ndjson might return:
+        {"id": 3, "title": "Broken link", "status": "Open"}
+        {"id": 4, "title": "Slow search", "status": "In Progress"}
     """
-    bugs = Bug.query.all()
-    bug_list = []
-    for bug in bugs:
-        bug_dict = {
-            'id': bug.id,
-            'title': bug.title,
-            'description': bug.description,
-            'status': bug.status,
-            'priority': bug.priority,
-            'date_created': bug.date_created.strftime('%Y-%m-%d %H:%M:%S')
-        }
-        bug_list.append(bug_dict)
-    return jsonify(bug_list)
+    try:
+        query, fields, output_format, limit = export_query(request.args)
+    except ValueError as error:
+        return jsonify({'error': str(error)}), 400
+    serialize = serializers.iter_ndjson if output_format == 'ndjson' else serializers.iter_json_array
+    mimetype = EXPORT_MIMETYPES[output_format]
+
+    def generate():
+        # yield_per makes the cursor hand back EXPORT_BATCH_SIZE rows at a time instead of buffering all of them
+        result = storage.read(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        return serialize(result.partitions(), fields)
+
+    if limit is not None and limit <= EXPORT_BATCH_SIZE:
+        # a single page is small enough to build in memory, which also lets the response cache keep it
+        return Response(''.join(generate()), mimetype=mimetype)
+    return Response(stream_with_context(generate()), mimetype=mimetype)
 
 
 @views.route('/bugs', methods=['POST'])
@@ -137,10 +232,63 @@ def update_bug(bug_id):
     bug.description = data['description']
     bug.status = data['status']
     bug.priority = data['priority']
+    bug.version = Bug.version + 1
     db.session.commit()
     return jsonify({'message': 'Bug updated successfully'}), 200
 
 
+@views.route('/bugs/<int:bug_id>', methods=['PATCH'])
+@login_required
+def patch_bug(bug_id):
+    """
+    Updates some of the fields of a bug, optionally only if nobody else changed it in the meantime.
+
+    Returns:
+        JSON: The new version of the bug, a 400 error for an invalid body, a 404 error if the bug does not
+        exist, or a 409 error with the current version if the bug changed since the given version.
+
+    Notes:
+        - The body has any of 'title', 'description', 'status', 'priority' and 'date_created', like the items
+          of PATCH /bugs/batch. Only those columns are written.
+        - With a 'version' (as returned by GET /bugs/<id>) the update only applies if the bug is still at that
+          version, so two people editing the same bug cannot silently overwrite each other. Without it the last
+          write wins, like with PUT.
+        - The update is a single UPDATE ... WHERE id = ? AND version = ? RETURNING version, the bug is not read
+          first. Only when no row matched is its version looked up, to tell a 404 from a 409.
+        - PUT and PATCH /bugs/batch increment the version as well.
+
+    Example Request (JSON):
+        {
+            'status': 'Resolved',
+            'version': 3
+        }
+
+    Example Response (JSON):
+        {
+            'message': 'Bug updated successfully',
+            'version': 4
+        }
+    """
+    try:
+        values, version = batch.validate_bug_patch(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    statement = update(Bug).where(Bug.id == bug_id)
+    if version is not None:
+        statement = statement.where(Bug.version == version)
+    statement = statement.values(**values, version=Bug.version + 1).returning(Bug.version)
+    new_version = db.session.scalar(statement.execution_options(synchronize_session=False))
+    if new_version is None:
+        current_version = db.session.scalar(select(Bug.version).where(Bug.id == bug_id))
+        db.session.rollback()
+        if current_version is None:
+            return jsonify({'error': 'Bug not found'}), 404
+        return jsonify({'error': 'Bug was changed by someone else', 'version': current_version}), 409
+    db.session.commit()
+    return jsonify({'message': 'Bug updated successfully', 'version': new_version}), 200
+
+
 @views.route('/bugs/<int:bug_id>', methods=['DELETE'])
 @login_required
 def delete_bug(bug_id):
@@ -150,42 +298,610 @@ def delete_bug(bug_id):
     return jsonify({'message': 'Bug deleted successfully'}), 200
 
 
+@views.route('/bugs/batch', methods=['POST'])
+@login_required
+def create_bugs():
+    """
+    Create many bug reports in one request.
+
+    Returns:
+        JSON: One result per item, in the order of the request, with the id of every new bug (201),
+        or a 400 error listing the invalid items.
+
+    Notes:
+        - The body is a JSON array of bugs like the one accepted by POST /bugs, or the same objects as
+          NDJSON (Content-Type 'application/x-ndjson'), one per line.
+        - An item can carry its own 'date_created' ('YYYY-MM-DD HH:MM:SS'), e.g. when importing bugs from
+          another tracker. Otherwise the current date and time is used.
+        - Every item is validated before anything is written. If one of them is invalid nothing is created.
+        - The bugs are written with a multi-row INSERT per chunk of BATCH_CHUNK_SIZE items (1000 by default),
+          each chunk in its own transaction.
+
+    Example Response (JSON):
+        {
+            'results': [
+                {'index': 0, 'status': 'created', 'bug_id': 11},
+                {'index': 1, 'status': 'created', 'bug_id': 12}
+            ]
+        }
+    """
+    try:
+        items = batch.read_items()
+    except batch.BatchError as e:
+        return jsonify({'error': str(e)}), 400
+    bugs, errors = batch.validate(items, batch.validate_new_bug)
+    if errors:
+        return jsonify({'error': 'Invalid items', 'errors': errors}), 400
+
+    results = []
+    statement = insert(Bug).returning(Bug.id, sort_by_parameter_order=True)
+    for chunk in batch.chunks(bugs):
+        for bug in chunk:
+            bug['user_id'] = current_user.id
+        bug_ids = db.session.scalars(statement, chunk).all()
+        db.session.commit()
+        for bug_id in bug_ids:
+            results.append({'index': len(results), 'status': 'created', 'bug_id': bug_id})
+    return jsonify({'results': results}), 201
+
+
+@views.route('/bugs/batch', methods=['PATCH'])
+@login_required
+def update_bugs():
+    """
+    Update many bug reports in one request.
+
+    Returns:
+        JSON: One result per item, 'updated' or 'not_found', or a 400 error listing the invalid items.
+
+    Notes:
+        - Every item has the 'id' of a bug and any of 'title', 'description', 'status', 'priority' and
+          'date_created'. Only the given fields are changed.
+        - The body is a JSON array or NDJSON, see create_bugs. Every item is validated before anything is written.
+        - Per chunk of BATCH_CHUNK_SIZE items, one SELECT finds the bugs that exist and the updates are sent as
+          executemany UPDATE statements, in one transaction. Each of them increments the version of its bug.
+    """
+    try:
+        items = batch.read_items()
+    except batch.BatchError as e:
+        return jsonify({'error': str(e)}), 400
+    updates, errors = batch.validate(items, batch.validate_bug_changes)
+    if errors:
+        return jsonify({'error': 'Invalid items', 'errors': errors}), 400
+
+    results = []
+    for chunk in batch.chunks(updates):
+        existing = set(db.session.scalars(select(Bug.id).where(Bug.id.in_([change['id'] for change in chunk]))))
+        found = [change for change in chunk if change['id'] in existing]
+        if found:
+            db.session.execute(update(Bug).values(version=Bug.version + 1), found)
+        db.session.commit()
+        for change in chunk:
+            results.append({
+                'index': len(results),
+                'status': 'updated' if change['id'] in existing else 'not_found',
+                'bug_id': change['id'],
+            })
+    return jsonify({'results': results}), 200
+
+
+@views.route('/bugs/batch', methods=['DELETE'])
+@login_required
+def delete_bugs():
+    """
+    Delete many bug reports in one request.
+
+    Returns:
+        JSON: One result per item, 'deleted' or 'not_found', or a 400 error listing the invalid items.
+
+    Notes:
+        - The body is a JSON array (or NDJSON) of bug ids, or of objects with an 'id'.
+        - Each chunk of BATCH_CHUNK_SIZE ids is removed with a single DELETE ... WHERE id IN (...).
+    """
+    try:
+        items = batch.read_items()
+    except batch.BatchError as e:
+        return jsonify({'error': str(e)}), 400
+    bug_ids, errors = batch.validate(items, batch.validate_bug_id)
+    if errors:
+        return jsonify({'error': 'Invalid items', 'errors': errors}), 400
+
+    results = []
+    for chunk in batch.chunks(bug_ids):
+        existing = set(db.session.scalars(select(Bug.id).where(Bug.id.in_(chunk))))
+        db.session.execute(delete(Bug).where(Bug.id.in_(existing)).execution_options(synchronize_session=False))
+        db.session.commit()
+        for bug_id in chunk:
+            results.append({
+                'index': len(results),
+                'status': 'deleted' if bug_id in existing else 'not_found',
+                'bug_id': bug_id,
+            })
+            existing.discard(bug_id)  # a repeated id is only deleted once
+    return jsonify({'results': results}), 200
+
+
 @views.route('/search')
 @login_required
+@httpcache.cached_response('bugs')
 def search_bug():
-    keyword = request.args.get('keyword')
-    category = request.args.get('category')
+    """
+    Search bug reports by title, full text, status, priority or creation date.
+
+    Query Parameters:
+        keyword (str): The text to search for.
+        category (str): One of 'title', 'text', 'status', 'priority' or 'date_created'.
+        from (str): Only bugs created at or after this date ('YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS').
+        to (str): Only bugs created up to and including this date or second.
+        include_archived (str): '1' to also search the archived bugs. They follow the other matches, in id order.
+
+    Returns:
+        JSON: A list of matching bug reports, or a 400 error for an invalid category or date.
+
+    Notes:
+        - 'title' and 'text' are answered from the bug_fts full-text index, so their cost grows with the
+          number of matches instead of the size of the bug table. Every word of the keyword is matched as a
+          prefix ('ali' finds 'Alignment'), words in the middle of other words are not found.
+        - 'title' only looks at titles and keeps the bugs in id order. 'text' looks at titles and descriptions
+          and orders the bugs by bm25 relevance, best match first.
+        - Without FTS5 support in sqlite both categories fall back to ILIKE scans.
+        - 'status' and 'priority' match the known values containing the keyword (case insensitive, so 'prog'
+          finds 'In Progress') plus the keyword itself, and look them up through the indexes on those columns.
+        - 'date_created' matches the whole second ('2023-09-09 14:30:00') or the whole day ('2023-09-09') given
+          as keyword. The keyword can be left empty when 'from' and/or 'to' are given.
+        - 'from' and 'to' can be combined with every category.
+        - The archive has no full-text index and only an index on user_id, so include_archived reads it in
+          full, with ILIKE for 'title' and 'text'. The cold tier is kept small on disk instead of fast to search.
+    """
+    try:
+        query = search_query(request.args, current_app.config.get('FULL_TEXT_SEARCH'))
+    except ValueError as error:
+        return jsonify({'error': str(error)}), 400
+
+    rows = storage.read(query).all()
+    return serializers.json_response(serializers.rows_to_dicts(rows))
+
+
+@views.route('/bugs/facets')
+@login_required
+@httpcache.cached_response('bugs')
+def bug_facets():
+    """
+    Counts bug reports by status, priority and day of creation.
+
+    Query Parameters:
+        status (str): Only count bugs with this status. Can be repeated.
+        priority (str): Only count bugs with this priority. Can be repeated.
+        from (str): Only count bugs created at or after this date ('YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS').
+        to (str): Only count bugs created up to and including this date or second.
+
+    Returns:
+        JSON: The number of matching bugs and their breakdowns, or a 400 error for an invalid date.
+
+    Notes:
+        - All three breakdowns come from a single GROUP BY status, priority, day query. With a status filter,
+          or no filter at all (a scan of the whole index), it is answered from the (status, priority,
+          date_created) index without reading the bug rows. A priority filter alone or from/to look the bugs
+          up through the priority or date_created index and read the matching rows.
+        - Dashboards can draw their charts from this endpoint instead of downloading every bug from /json.
+
+    Example Response (JSON):
+        {
+            'total': 3,
+            'status': {'Open': 2, 'Resolved': 1},
+            'priority': {'High': 1, 'Low': 2},
+            'day': {'2023-09-08': 1, '2023-09-09': 2}
+        }
+    """
+    try:
+        filters = _date_range_filters(request.args)
+    except ValueError:
+        return jsonify({'error': 'Invalid date format'}), 400
+    if request.args.getlist('status'):
+        filters.append(Bug.status.in_(request.args.getlist('status')))
+    if request.args.getlist('priority'):
+        filters.append(Bug.priority.in_(request.args.getlist('priority')))
+
+    day = func.date(Bug.date_created)
+    rows = storage.read(
+        select(Bug.status, Bug.priority, day, func.count()).where(*filters).group_by(Bug.status, Bug.priority, day)
+    )
+
+    facets = {'total': 0, 'status': {}, 'priority': {}, 'day': {}}
+    for status, priority, day, count in rows:
+        facets['total'] += count
+        facets['status'][status] = facets['status'].get(status, 0) + count
+        facets['priority'][priority] = facets['priority'].get(priority, 0) + count
+        facets['day'][day] = facets['day'].get(day, 0) + count
+    return jsonify(facets)
 
-    # Query the database based on the provided keyword and category
-    if category == 'title':
-        bugs = Bug.query.filter(Bug.title.ilike(f'%{keyword}%')).all()
+
+@views.route('/stats')
+@login_required
+@httpcache.cached_response('bugs')
+def bug_stats():
+    """
+    Counts the current user's bug reports by status and priority.
+
+    Returns:
+        JSON: The number of bugs of the user, broken down by status, by priority and by both.
+
+    Notes:
+        - The counts are read from the bug_stats table, which the triggers of website.schema update with
+          every write to the bug table. The response costs a primary key range read of a few rows,
+          however many bugs the user has.
+        - Archived bugs are still counted, under the status they were archived with.
+
+    Example Response (JSON):
+        {
+            'total': 3,
+            'status': {'Open': 2, 'Resolved': 1},
+            'priority': {'High': 1, 'Low': 2},
+            'breakdown': [
+                {'status': 'Open', 'priority': 'High', 'count': 1},
+                {'status': 'Open', 'priority': 'Low', 'count': 1},
+                {'status': 'Resolved', 'priority': 'Low', 'count': 1}
+            ]
+        }
+    """
+    return jsonify(stats.user_stats(current_user.id))
+
+
+@views.route('/bugs/changes')
+@login_required
+@httpcache.cached_response('bugs')
+def bug_changes():
+    """
+    Lists the changes made to bug reports after a point of the change log.
+
+    Query Parameters:
+        since (int): Only return changes with a seq greater than this value. Defaults to 0.
+        limit (int): Maximum number of changes to return, CHANGES_PAGE_SIZE (100) by default and at most 1000.
+
+    Returns:
+        JSON: The changes, oldest first, and the seq to pass as 'since' next time, or a 400 error for
+        invalid parameters.
+
+    Notes:
+        - Every write to the bug table adds one change, in the same transaction: creations, updates and
+          deletions, including the batch endpoints and account deletion. Bugs moved to the archive by
+          `flask archive-bugs` get an 'archive' change instead of a 'delete'.
+        - Clients that want the changes as they happen should open /bugs/changes/stream instead of polling.
+
+    Example Response (JSON):
+        {
+            'changes': [
+                {'seq': 41, 'op': 'update', 'bug_id': 3, 'user_id': 1, 'title': 'Broken link',
+                 'status': 'Resolved', 'priority': 'Low', 'changed_at': '2023-09-09 14:30:00'}
+            ],
+            'last_seq': 41
+        }
+    """
+    try:
+        since, limit = changes_page(request.args)
+    except ValueError as error:
+        return jsonify({'error': str(error)}), 400
+
+    change_list = changes.read_changes(since, limit)
+    last_seq = change_list[-1]['seq'] if change_list else since
+    return serializers.json_response({'changes': change_list, 'last_seq': last_seq})
+
+
+@views.route('/bugs/changes/stream')
+@login_required
+def stream_bug_changes():
+    """
+    Pushes the changes made to bug reports as Server-Sent Events.
+
+    Query Parameters:
+        since (int): Start after this seq of the change log. Defaults to the changes made from now on.
+
+    Headers:
+        Last-Event-ID: Sent by EventSource when it reconnects, takes precedence over 'since'.
+
+    Returns:
+        text/event-stream: One event per change, named after its op ('create', 'update', 'delete' or
+        'archive'), with the change of /bugs/changes as data and its seq as id. A comment line is sent every
+        CHANGE_STREAM_KEEPALIVE seconds (15 by default) while nothing changes.
+
+    Notes:
+        - The stream is closed after CHANGE_STREAM_MAX_AGE seconds (300 by default). EventSource then
+          reconnects with Last-Event-ID and resumes without losing or repeating a change, which also lets
+          the worker serve other requests in between.
+        - All open streams of a process share one reader of the change log, see changes.ChangeFeed.
+        - Every open stream holds a thread of the WSGI server, so a process serves at most
+          CHANGE_STREAM_MAX_OPEN (2 by default) at once and answers 503 with Retry-After beyond that,
+          instead of letting the streams take every thread of the worker. For many clients, serve the
+          streams with the ASGI entry point (uvicorn asgi:app), where this route runs on the event loop.
+
+    Example:
+        const source = new EventSource('/bugs/changes/stream');
+        source.addEventListener('update', event => console.log(JSON.parse(event.data)));
+    """
+    since = request.headers.get('Last-Event-ID') or request.args.get('since')
+    try:
+        since = int(since) if since is not None else None
+    except ValueError:
+        return jsonify({'error': 'since must be an integer'}), 400
+
+    slots = current_app.extensions['change_stream_slots']
+    if not slots.acquire(blocking=False):
+        return jsonify({'error': 'Too many open change streams, please try again later.'}), 503, \
+            {'Retry-After': str(STREAM_RETRY_AFTER)}
+
+    feed = current_app.extensions['change_feed']
+    keepalive = current_app.config.get('CHANGE_STREAM_KEEPALIVE', 15)
+    deadline = time.monotonic() + current_app.config.get('CHANGE_STREAM_MAX_AGE', 300)
+
+    def generate():
+        yield 'retry: 1000\n\n'
+        for event in feed.events(since, timeout=keepalive):
+            yield event if event is not None else ': keepalive\n\n'
+            if time.monotonic() > deadline:
+                return
+
+    # no stream_with_context: the stream can outlive many requests, the feed reads in its own app context
+    response = Response(generate(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # called by the server when the stream ends or the client goes away, even before the first event
+    response.call_on_close(slots.release)
+    return response
+
+
+def export_query(args):
+    """
+    Builds the SELECT of a /json request from its query parameters (see get_bugs).
+
+    Returns:
+        tuple: (query, fields, output_format, limit), fields being the bug attributes in the order selected
+            and limit None when the whole table is requested.
+
+    Raises:
+        ValueError: For an invalid parameter, with the message to return to the client.
+    """
+    try:
+        after = int(args.get('after', 0))
+        limit = args.get('limit')
+        limit = int(limit) if limit is not None else None
+    except ValueError:
+        raise ValueError('after and limit must be integers')
+    if limit is not None and limit < 0:
+        raise ValueError('limit must not be negative')
+
+    fields = args.get('fields')
+    if fields:
+        fields = [field.strip() for field in fields.split(',') if field.strip()]
+        unknown = [field for field in fields if field not in serializers.BUG_FIELDS]
+        if unknown:
+            raise ValueError(f'Unknown fields: {", ".join(unknown)}')
+        # keep the column order stable and always include the cursor column
+        fields = [field for field in serializers.BUG_FIELDS if field == 'id' or field in fields]
+    else:
+        fields = serializers.BUG_FIELDS
+
+    output_format = args.get('format', 'json')
+    if output_format not in EXPORT_MIMETYPES:
+        raise ValueError('Invalid format')
+
+    query = serializers.select_bugs(fields).where(Bug.id > after)
+    if include_archived(args):
+        # both tables are read in primary key order, sqlite merges the two instead of sorting
+        query = union_all(query, serializers.select_bugs(fields, BugArchive).where(BugArchive.id > after))
+        query = query.order_by(query.selected_columns.id)
+    else:
+        query = query.order_by(Bug.id)
+    if limit is not None:
+        query = query.limit(limit)
+    return query, fields, output_format, limit
+
+
+def search_query(args, full_text=True):
+    """
+    Builds the SELECT of a /search request from its query parameters (see search_bug).
+
+    Args:
+        args: The query parameters.
+        full_text (bool): Whether the bug_fts index exists, i.e. the app's FULL_TEXT_SEARCH setting.
+
+    Raises:
+        ValueError: For an invalid category or date, with the message to return to the client.
+    """
+    query = _search_tier(Bug, args, full_text)
+    if not include_archived(args):
+        return query
+    # the archive has no full-text index and no index on the searched columns, it is scanned
+    archived = _search_tier(BugArchive, args, full_text=False).order_by(BugArchive.id)
+    return union_all(select(query.subquery()), select(archived.subquery()))
+
+
+def include_archived(args):
+    """Whether a /json or /search request asks for the archived bugs too ('include_archived=1')."""
+    return args.get('include_archived', '').lower() in ('1', 'true', 'yes')
+
+
+def changes_page(args):
+    """The (since, limit) of a /bugs/changes request. Raises ValueError with the message for the client."""
+    try:
+        since = int(args.get('since', 0))
+        limit = min(int(args.get('limit', CHANGES_PAGE_SIZE)), 1000)
+    except ValueError:
+        raise ValueError('since and limit must be integers')
+    if limit < 0:
+        raise ValueError('limit must not be negative')
+    return since, limit
+
+
+def _dashboard_args():
+    """
+    The (after, sort) requested from the dashboard, falling back to the first page of the newest bugs.
+
+    'after' is the cursor of _dashboard_page parsed back into its values: the rank for the priority and status
+    orders, then the date_created and id of the last bug shown. Aborts with 400 for a malformed cursor.
+    """
+    sort = request.args.get('sort')
+    sort = sort if sort in INDEX_SORTS else 'newest'
+    after = request.args.get('after')
+    if after is None:
+        return None, sort
+    try:
+        *rank, date_created, bug_id = after.split(',')
+        after = tuple(int(value) for value in rank) + (datetime.fromisoformat(date_created), int(bug_id))
+    except ValueError:
+        abort(400)
+    if len(rank) != (INDEX_SORTS[sort][0] is not None):
+        abort(400)
+    return after, sort
+
+
+def _dashboard_page(after, sort):
+    """
+    Loads a page of the current user's bugs for the dashboard templates.
+
+    Args:
+        after (tuple): The sort values of the last bug of the previous page (see _dashboard_args), None for
+            the first page.
+        sort (str): One of INDEX_SORTS.
+
+    Returns:
+        dict: The template context: 'bugs', 'sort', 'summary_length' and 'next_page', the cursor of the page
+        after this one (None on the last page).
+
+    Notes:
+        - A page is a range of the (user_id, date_created) index for newest and oldest, and of the
+          (user_id, rank, date_created) index of the order for priority and status (see models.Bug). No
+          OFFSET: the bugs of the previous pages are neither read nor sorted again.
+        - sqlite does not seek on a (rank, date_created, id) row value, so a page of a ranked order is read
+          as the rest of the last rank followed by the next ranks, two ranges of the index.
+    """
+    page_size = current_app.config.get('INDEX_PAGE_SIZE', 50)
+    limit = page_size + 1  # one more row tells whether there is a next page, no COUNT needed
+    rank, descending = INDEX_SORTS[sort]
+
+    def read(order, *filters, count=limit):
+        query = (
+            serializers.select_bug_summaries()
+            .add_columns(Bug.date_created.label('sort_date'), *([rank.label('sort_rank')] if rank is not None else []))
+            .where(Bug.user_id == current_user.id, *filters)
+            .order_by(*[column.desc() if descending else column for column in order])
+            .limit(count)
+        )
+        return storage.read(query).all()
+
+    position = (Bug.date_created, Bug.id)
+    if after is None:
+        bugs = read(((rank,) if rank is not None else ()) + position)
+    else:
+        *after_rank, after_date, after_id = after
+        later = tuple_(*position) < tuple_(after_date, after_id) if descending else \
+            tuple_(*position) > tuple_(after_date, after_id)
+        if rank is None:
+            bugs = read(position, later)
+        else:
+            bugs = read(position, rank == after_rank[0], later)
+            if len(bugs) < limit:
+                next_ranks = rank < after_rank[0] if descending else rank > after_rank[0]
+                bugs += read((rank,) + position, next_ranks, count=limit - len(bugs))
+    profiling.add_rows(len(bugs))
+
+    next_page = None
+    if len(bugs) > page_size:
+        last = bugs[page_size - 1]
+        values = ([last.sort_rank] if rank is not None else []) + [last.sort_date.isoformat(), last.id]
+        next_page = ','.join(str(value) for value in values)
+    return {
+        'bugs': bugs[:page_size],
+        'sort': sort,
+        'summary_length': serializers.SUMMARY_LENGTH,
+        'next_page': next_page,
+    }
+
+
+def _date_bounds(value):
+    """
+    Returns the (start, end) datetimes covered by a date typed by the user, end excluded.
+
+    'YYYY-MM-DD HH:MM:SS' covers that second and 'YYYY-MM-DD' the whole day. Bugs are stored with
+    microseconds, so an equality test against the typed timestamp would never match.
+    Raises ValueError for anything else.
+    """
+    value = (value or '').strip()  # a missing date is invalid like any other
+    try:
+        start = datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
+        return start, start + timedelta(seconds=1)
+    except ValueError:
+        start = datetime.strptime(value, '%Y-%m-%d')
+        return start, start + timedelta(days=1)
+
+
+def _date_range_filters(args, model=Bug):
+    """Filter clauses for the 'from' and 'to' query parameters, both inclusive. Raises ValueError for bad dates."""
+    filters = []
+    if args.get('from'):
+        filters.append(model.date_created >= _date_bounds(args['from'])[0])
+    if args.get('to'):
+        filters.append(model.date_created < _date_bounds(args['to'])[1])
+    return filters
+
+
+def _matching_values(keyword, known_values):
+    """
+    Expands a status or priority keyword into the exact values to look up.
+
+    A substring ILIKE on these columns cannot use an index, but the values come from a short fixed list,
+    so the substring match is done on the list instead and the query becomes an indexed IN (...).
+    """
+    keyword = keyword or ''
+    values = [value for value in known_values if keyword.lower() in value.lower()]
+    if keyword not in values:
+        values.append(keyword)  # statuses created through the API outside of the known list
+    return values
+
+
+def _search_tier(model, args, full_text):
+    """Builds the query of a /search request on the bug table or on the archive (see search_query)."""
+    keyword = args.get('keyword')
+    category = args.get('category')
+
+    try:
+        date_range = _date_range_filters(args, model)
+    except ValueError:
+        raise ValueError('Invalid date format')
+
+    if category in ('title', 'text'):
+        query = _full_text_search(keyword, category, full_text, model)
     elif category == 'status':
-        bugs = Bug.query.filter(Bug.status.ilike(f'%{keyword}%')).all()
+        query = serializers.select_bugs(model=model).where(model.status.in_(_matching_values(keyword, BUG_STATUSES)))
     elif category == 'priority':
-        bugs = Bug.query.filter(Bug.priority.ilike(f'%{keyword}%')).all()
+        query = serializers.select_bugs(model=model).where(
+            model.priority.in_(_matching_values(keyword, BUG_PRIORITIES))
+        )
     elif category == 'date_created':
-        # Convert the keyword to a datetime object and query the database
-        try:
-            keyword_date = datetime.strptime(keyword, '%Y-%m-%d %H:%M:%S')
-            bugs = Bug.query.filter(Bug.date_created == keyword_date).all()
-        except ValueError:
-            return jsonify({'error': 'Invalid date format'}), 400
+        query = serializers.select_bugs(model=model)
+        if keyword or not date_range:
+            # Convert the keyword to the range of times it covers and query the database
+            try:
+                start, end = _date_bounds(keyword)
+            except ValueError:
+                raise ValueError('Invalid date format')
+            query = query.where(model.date_created >= start, model.date_created < end)
     else:
-        return jsonify({'error': 'Invalid category'}), 400
-
-
-    # Convert the bugs to a list of dictionaries for JSON response
-    bug_list = []
-    for bug in bugs:
-        bug_dict = {
-            'id': bug.id,
-            'title': bug.title,
-            'description': bug.description,
-            'status': bug.status,
-            'priority': bug.priority,
-            'date_created': bug.date_created.strftime('%Y-%m-%d %H:%M:%S')
-        }
-        bug_list.append(bug_dict)
+        raise ValueError('Invalid category')
+    return query.where(*date_range)
+
+
+def _full_text_search(keyword, category, full_text, model=Bug):
+    """Builds the query for a 'title' or 'text' search through the full-text index (see search_bug)."""
+    query = serializers.select_bugs(model=model)
+    if not full_text:
+        if category == 'title':
+            return query.where(model.title.ilike(f'%{keyword}%'))
+        return query.where(or_(model.title.ilike(f'%{keyword}%'), model.description.ilike(f'%{keyword}%')))
 
-    return jsonify(bug_list)
+    expression = search.match_expression(keyword, 'title' if category == 'title' else None)
+    if expression is None:  # nothing searchable in the keyword, like ILIKE '%%' this matches every bug
+        return query.order_by(Bug.id)
 
+    query = query.join(search.bug_fts, search.bug_fts.c.rowid == Bug.id).where(search.matches(expression))
+    if category == 'text':
+        return query.order_by(search.rank())
+    return query.order_by(Bug.id)
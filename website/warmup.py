@@ -0,0 +1,64 @@
+import time
+from . import db
+
+
+def precompile_templates(app):
+    """
+    Compiles every Jinja template of an app into its template cache.
+
+    Returns:
+        int: The number of templates compiled.
+
+    Notes:
+        - Done in gunicorn's master with preload_app, the compiled templates are shared with every worker it
+          forks, so a recycled worker does not pay for compiling them on its first requests.
+    """
+    names = app.jinja_env.list_templates()
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
+
+
+def prime_pool(app):
+    """
+    Opens the connections of every engine of an app up to its pool size and returns them to the pool.
+
+    Returns:
+        int: The number of connections opened.
+
+    Notes:
+        - The PRAGMAs of website.storage run when a connection is opened, so the first requests find ready
+          connections instead of paying for that setup.
+        - sqlite connections must not cross a fork: call this in the worker, after the engines inherited from
+          the master have been disposed (see gunicorn.conf.py).
+    """
+    opened = 0
+    with app.app_context():
+        for engine in db.engines.values():
+            size = getattr(engine.pool, 'size', None)  # only QueuePool has a size
+            connections = [engine.connect() for _ in range(size() if size else 1)]
+            for connection in connections:
+                connection.close()
+            opened += len(connections)
+    return opened
+
+
+def dispose_engines(app):
+    """Drops the connections inherited from a parent process without closing them under its feet."""
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+def warm_up(app):
+    """
+    Precompiles the templates and primes the connection pools of an app.
+
+    Called by create_app when WARM_UP is set, for servers that do not fork after loading the app
+    (`flask run`, uvicorn). With gunicorn, gunicorn.conf.py calls the two steps where they belong instead.
+    """
+    started = time.perf_counter()
+    templates = precompile_templates(app)
+    connections = prime_pool(app)
+    app.logger.info('Warmed up in %.0f ms: %d templates compiled, %d connections opened',
+                    (time.perf_counter() - started) * 1000, templates, connections)